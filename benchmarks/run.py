@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+git-fat benchmark suite. Measures the filters, index discovery, push and pull against an in-process S3
+stand-in (moto) and CLI startup, then writes machine readable JSON results.
+
+    pip install 'moto[s3]'
+    python -m benchmarks.run --output results.json
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from importlib.metadata import version
+from pathlib import Path
+from typing import Callable, List
+
+import boto3
+
+from benchmarks.synthetic import RepoSpec, cached_objects, make_repo
+from git_fat.utils import FatRepo
+
+BUCKET = "fatstore-bench"
+GITFAT_CONFIG = f"[s3]\nbucket = 's3://{BUCKET}'\n"
+MIB = 1024 * 1024
+
+
+@dataclass
+class Result:
+    name: str
+    seconds: float
+    count: int = 0
+    bytes: int = 0
+
+    def to_json(self) -> dict:
+        result = asdict(self)
+        if self.bytes:
+            result["mib_per_second"] = self.bytes / MIB / self.seconds
+        if self.count:
+            result["per_second"] = self.count / self.seconds
+        return result
+
+
+def best_of(repeat: int, func: Callable[[], None], setup: Callable[[], None] = lambda: None) -> float:
+    """
+    Returns the fastest of repeat timed runs of func, setup runs untimed before each one
+    """
+    timings = []
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def bench_filters(workdir: Path, size: int, repeat: int) -> List[Result]:
+    fatrepo = make_repo(workdir / "filters", RepoSpec(files=1, median_size=1, max_size=1), GITFAT_CONFIG)
+    data_path = workdir / "filters.bin"
+    data_path.write_bytes(os.urandom(size))
+    fatid = hashlib.sha1(data_path.read_bytes()).hexdigest()
+
+    def clean():
+        with open(data_path, "rb") as input_handle, open(os.devnull, "wb") as output_handle:
+            fatrepo.filter_clean(input_handle, output_handle)
+
+    def smudge():
+        with io.BytesIO(fatrepo.encode_fatstub(fatid, size).encode()) as input_handle:
+            with open(os.devnull, "wb") as output_handle:
+                fatrepo.filter_smudge(input_handle, output_handle)
+
+    clean_seconds = best_of(repeat, clean, lambda: fatrepo.object_path(fatid).unlink(missing_ok=True))
+    smudge_seconds = best_of(repeat, smudge)
+    return [
+        Result("filter_clean", clean_seconds, bytes=size),
+        Result("filter_smudge", smudge_seconds, bytes=size),
+    ]
+
+
+def bench_index(workdir: Path, spec: RepoSpec, repeat: int) -> List[Result]:
+    fatrepo = make_repo(workdir / "index", spec, GITFAT_CONFIG)
+    seconds = best_of(repeat, fatrepo.get_indexed_fatobjs)
+    return [Result("get_indexed_fatobjs", seconds, count=spec.files)]
+
+
+def bench_transfers(workdir: Path, name: str, spec: RepoSpec) -> List[Result]:
+    """
+    Pushes a synthetic repository to an empty bucket prefix, then pulls everything into a fresh clone
+    """
+    source = workdir / f"{name}-source"
+    config = GITFAT_CONFIG + f"prefix = '{name}'\n"
+    fatrepo = make_repo(source, spec, config)
+    count, nbytes = cached_objects(fatrepo)
+
+    start = time.perf_counter()
+    fatrepo.push()
+    push_seconds = time.perf_counter() - start
+
+    clone = workdir / f"{name}-clone"
+    subprocess.run(["git", "clone", "-q", str(source), str(clone)], check=True)
+    cloned_fatrepo = FatRepo(clone)
+    start = time.perf_counter()
+    cloned_fatrepo.pull_all()
+    pull_seconds = time.perf_counter() - start
+    return [
+        Result(f"push_{name}", push_seconds, count=count, bytes=nbytes),
+        Result(f"pull_{name}", pull_seconds, count=count, bytes=nbytes),
+    ]
+
+
+def bench_cli_startup(repeat: int) -> List[Result]:
+    git_fat = shutil.which("git-fat")
+    if git_fat is None:
+        return []
+    seconds = best_of(repeat, lambda: subprocess.run([git_fat, "-v"], check=True, stdout=subprocess.DEVNULL))
+    return [Result("cli_startup", seconds, count=1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-o", "--output", default="-", help="JSON results file, defaults to STDOUT")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per timing, the fastest one is reported")
+    parser.add_argument("--filter-size", type=int, default=256 * MIB, help="Bytes passed through the filters")
+    parser.add_argument("--index-files", type=int, default=20000, help="Fat files in the index benchmark repo")
+    parser.add_argument("--small-files", type=int, default=2000, help="Files in the many small objects repo")
+    parser.add_argument("--small-size", type=int, default=8 * 1024, help="Median size of small objects")
+    parser.add_argument("--large-files", type=int, default=4, help="Files in the few large objects repo")
+    parser.add_argument("--large-size", type=int, default=64 * MIB, help="Median size of large objects")
+    parser.add_argument("--depth", type=int, default=3, help="Commits in the history of transfer repos")
+    args = parser.parse_args()
+
+    try:
+        from moto import mock_aws
+    except ImportError:
+        print("benchmarks need moto, pip install 'moto[s3]'", file=sys.stderr)
+        sys.exit(1)
+
+    for key, value in [("AWS_ACCESS_KEY_ID", "bench"), ("AWS_SECRET_ACCESS_KEY", "bench")]:
+        os.environ.setdefault(key, value)
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+    small = RepoSpec(args.small_files, args.small_size, args.small_size * 16, depth=args.depth)
+    large = RepoSpec(args.large_files, args.large_size, args.large_size * 2, depth=args.depth)
+    index = RepoSpec(files=args.index_files, median_size=64, max_size=256)
+
+    results: List[Result] = []
+    with mock_aws(), tempfile.TemporaryDirectory() as tmpdir:
+        boto3.client("s3").create_bucket(Bucket=BUCKET)
+        workdir = Path(tmpdir)
+        results += bench_filters(workdir, args.filter_size, args.repeat)
+        results += bench_index(workdir, index, args.repeat)
+        results += bench_transfers(workdir, "small", small)
+        results += bench_transfers(workdir, "large", large)
+    results += bench_cli_startup(args.repeat)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_fat_version": version("yelp-gitfat"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": vars(args),
+        "results": [result.to_json() for result in results],
+    }
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+    with open(args.output, "w") as output_handle:
+        json.dump(report, output_handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Synthetic git-fat repositories for benchmarks: N fat files with a log-normal size distribution,
+committed over a given history depth.
+"""
+
+import random
+import subprocess
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Tuple
+
+from git_fat.utils import FatRepo
+from git_fat.utils.fatrepo import OBJECT_NAME
+
+FILES_PER_DIRECTORY = 256
+
+
+@dataclass
+class RepoSpec:
+    files: int = 1000
+    median_size: int = 16 * 1024
+    max_size: int = 1024 * 1024
+    depth: int = 1
+    # fraction of files rewritten by each commit after the first one
+    churn: float = 0.1
+    seed: int = 0
+
+
+def git(workspace: Path, *args: str) -> str:
+    return subprocess.run(["git", *args], cwd=str(workspace), check=True, stdout=subprocess.PIPE, text=True).stdout
+
+
+def commit(workspace: Path, message: str, parent: str) -> str:
+    """
+    Commits the index with plumbing, git commit would refresh the index and run the clean filter on every file
+    """
+    tree = git(workspace, "write-tree").strip()
+    parents = ["-p", parent] if parent else []
+    sha = git(workspace, "commit-tree", tree, *parents, "-m", message).strip()
+    git(workspace, "update-ref", "HEAD", sha)
+    return sha
+
+
+def file_sizes(spec: RepoSpec, rng: random.Random):
+    for _ in range(spec.files):
+        size = int(rng.lognormvariate(0, 1) * spec.median_size)
+        yield max(1, min(size, spec.max_size))
+
+
+def make_repo(workspace: Path, spec: RepoSpec, gitfat_config: str) -> FatRepo:
+    """
+    Creates a repository in workspace holding spec.files fat files over spec.depth commits and returns its FatRepo.
+    Files are staged with git fat add, so generating large repositories doesn't spawn a filter per file.
+    """
+    rng = random.Random(spec.seed)
+    workspace.mkdir(parents=True, exist_ok=True)
+    git(workspace, "init", "-q", "-b", "master")
+    git(workspace, "config", "user.email", "bench@example.com")
+    git(workspace, "config", "user.name", "bench")
+    git(workspace, "config", "commit.gpgsign", "false")
+    (workspace / ".gitattributes").write_text("*.fat filter=fat -text\n")
+    (workspace / ".gitfat").write_text(gitfat_config)
+    fatrepo = FatRepo(workspace)
+
+    paths = [Path(f"data/{i // FILES_PER_DIRECTORY:04d}/{i:07d}.fat") for i in range(spec.files)]
+    sizes = list(file_sizes(spec, rng))
+    head = ""
+    for depth in range(spec.depth):
+        changed = (
+            range(spec.files) if depth == 0 else rng.sample(range(spec.files), max(1, int(spec.files * spec.churn)))
+        )
+        for i in changed:
+            path = workspace / paths[i]
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(rng.randbytes(sizes[i]))
+        fatrepo.add([".gitattributes", ".gitfat", "data"])
+        head = commit(workspace, f"synthetic commit {depth}", head)
+    return fatrepo
+
+
+def cached_objects(fatrepo: FatRepo) -> Tuple[int, int]:
+    """
+    Returns the number and total size of objects in the local cache, I.E. everything push uploads
+    """
+    sizes = [path.stat().st_size for path in fatrepo.objdir.rglob("*") if OBJECT_NAME.fullmatch(path.name)]
+    return len(sizes), sum(sizes)
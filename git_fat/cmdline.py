@@ -4,9 +4,13 @@ import argparse
 import sys
 import os
 import subprocess
-from typing import List
+from typing import Dict, List, Set, Tuple
 from pathlib import Path
-from git_fat.utils import FatRepo, NoArgs
+from git_fat.utils import FatRepo, FatObj, NoArgs
+from git_fat.utils.common import human_size
+from git_fat import tracing
+from git_fat.profiling import PROFILE_ENV, list_profiles, merge_profiles, profile_command, run_profiled
+from gitdb.exc import BadName
 from importlib.metadata import version
 
 __version__ = version("yelp-gitfat")
@@ -52,16 +56,21 @@ def get_valid_fpaths(files: List[str]) -> List[Path]:
 def init_cmd(_):
     print("git-fat: Configured clean and smudge filter", file=sys.stderr)
     with fatrepo.gitapi.config_writer() as cw:
-        cw.set_value('filter "fat"', "clean", "git fat filter-clean")
+        cw.set_value('filter "fat"', "clean", "git fat filter-clean %f")
         cw.set_value('filter "fat"', "smudge", "git fat filter-smudge")
 
 
-def clean_cmd(_):
-    fatrepo.filter_clean(sys.stdin.buffer, sys.stdout.buffer)
+def clean_cmd(args):
+    return fatrepo.filter_clean(sys.stdin.buffer, sys.stdout.buffer, args.path)
+
+
+def add_cmd(args):
+    curdir = Path(os.path.abspath(os.path.curdir))
+    fatrepo.add(args.pathspecs, cwd=curdir, jobs=args.jobs)
 
 
 def smudge_cmd(_):
-    fatrepo.filter_smudge(sys.stdin.buffer, sys.stdout.buffer)
+    return fatrepo.filter_smudge(sys.stdin.buffer, sys.stdout.buffer)
 
 
 def push_cmd(_):
@@ -69,23 +78,104 @@ def push_cmd(_):
 
 
 def pull_cmd(args):
+    if getattr(args, "all_history", None):
+        print("git-fat pull: downloading all files referenced in history", file=sys.stderr)
+        fatrepo.pull_history()
+        return
     if getattr(args, "all", None):
         print("git-fat pull: downloading and restoring all files in remote fatstore", file=sys.stderr)
         fatrepo.pull_all()
         return
-    if getattr(args, "files", None):
-        fpaths = get_valid_fpaths(args.files)
-        fatrepo.pull(fpaths)
+    if getattr(args, "files", None) or getattr(args, "include", None) or getattr(args, "exclude", None):
+        curdir = Path(os.path.abspath(os.path.curdir))
+        fatrepo.pull_pathspecs(args.files, args.include or [], args.exclude or [], cwd=curdir)
         return
 
-    print("git-fat pull: use --all or pass list files", file=sys.stderr)
+    print("git-fat pull: use --all or pass list of files or pathspecs", file=sys.stderr)
     sys.exit(1)
 
 
 def pull_new_cmd(args):
     if getattr(args, "ref_name", None):
-        given_ref = fatrepo.gitapi.commit(args.ref_name)
-        fatrepo.pull_new(given_ref)
+        fatrepo.pull_new_refs(args.ref_name)
+
+
+def read_pre_push_updates() -> List[Tuple[str, str, str, str]]:
+    """
+    Returns ref updates of a push, from pre-commit environment when run as a pre-commit hook,
+    otherwise from the "<local ref> <local sha> <remote ref> <remote sha>" lines git passes on STDIN
+    """
+    if os.environ.get("PRE_COMMIT_TO_REF"):
+        return [
+            (
+                os.environ.get("PRE_COMMIT_LOCAL_BRANCH", ""),
+                fatrepo.gitapi.commit(os.environ["PRE_COMMIT_TO_REF"]).hexsha,
+                os.environ.get("PRE_COMMIT_REMOTE_BRANCH", ""),
+                os.environ.get("PRE_COMMIT_FROM_REF") or "0" * 40,
+            )
+        ]
+
+    updates = []
+    for line in sys.stdin:
+        parts = line.split()
+        if len(parts) == 4:
+            updates.append((parts[0], parts[1], parts[2], parts[3]))
+    return updates
+
+
+def pre_push_cmd(args):
+    remote = args.remote or os.environ.get("PRE_COMMIT_REMOTE_NAME", "origin")
+    fatrepo.pre_push(remote, read_pre_push_updates())
+
+
+def remote_orphans_cmd(args):
+    rev_args = args.revs if args.revs else None
+    for remote_file in fatrepo.get_unreferenced_remote_files(rev_args):
+        print(remote_file)
+
+
+def prune_remote_cmd(args):
+    fatrepo.prune_remote(refs=args.ref, grace_days=args.grace_days, dry_run=args.dry_run)
+
+
+def status_cmd(args):
+    status = fatrepo.status(refresh_remote=args.remote)
+    print(f"stub-only files: {len(status.stubs)} ({human_size(status.stub_bytes)})")
+    if args.list:
+        for fatobj in status.stubs:
+            print(f"\t{fatobj.path}")
+    print(f"orphaned objects: {len(status.orphans)} ({human_size(status.orphan_bytes)})")
+    if args.list:
+        for name, _ in status.orphans:
+            print(f"\t{name}")
+    if status.unpushed is None:
+        print("unpushed objects: unknown, run git fat status --remote")
+        return
+    print(f"unpushed objects: {len(status.unpushed)} ({human_size(status.unpushed_bytes)})")
+    if args.list:
+        for fatobj in status.unpushed:
+            print(f"\t{fatobj.path}")
+
+
+def gitattributes_pattern(path: str) -> str:
+    """
+    Returns path as a .gitattributes pattern anchored at the repository root
+    """
+    for special in "\\*?[":
+        path = path.replace(special, "\\" + special)
+    return "/" + path.replace(" ", "[[:space:]]")
+
+
+def find_cmd(args):
+    large_paths = fatrepo.find_large_paths(args.threshold, args.revs or None)
+    patterns = [(gitattributes_pattern(path), max_size, count) for path, max_size, count in large_paths]
+    width = max((len(pattern) for pattern, _, _ in patterns), default=0)
+    for pattern, max_size, count in patterns:
+        print("%-*s filter=fat -text # %10d %d" % (width, pattern, max_size, count))
+
+
+def import_history_cmd(args):
+    fatrepo.import_history(args.revs or None, push=args.push)
 
 
 def fscheck_cmd(args):
@@ -98,32 +188,108 @@ def fscheck_cmd(args):
 
 def fscheck_new_cmd(args):
     if getattr(args, "ref_name", None):
-        given_ref = fatrepo.gitapi.commit(args.ref_name)
-        fatrepo.fatstore_check(given_ref)
+        fatrepo.fatstore_check_refs(args.ref_name)
 
 
 def fspublish_new_cmd(args):
     if getattr(args, "ref_name", None):
-        given_ref = fatrepo.gitapi.commit(args.ref_name)
-        fatrepo.publish_added_fatobjs(given_ref)
+        fatrepo.publish_added_fatobjs_refs(args.ref_name)
+
+
+def get_bundle_fatobjs(targets: List[str]) -> Set[FatObj]:
+    if len(targets) == 0:
+        return fatrepo.get_indexed_fatobjs()
+
+    fatobjs = set()
+    files = []
+    for target in targets:
+        if os.path.exists(target):
+            files.append(target)
+            continue
+        try:
+            fatobjs |= fatrepo.get_tree_fatobjs(fatrepo.gitapi.commit(target))
+        except (BadName, ValueError):
+            print(f"git-fat bundle: {target} is neither a path nor a valid REF", file=sys.stderr)
+            sys.exit(1)
+    if files:
+        fatobjs |= fatrepo.convert_file_list_to_fatobjs(get_valid_fpaths(files))
+    return fatobjs
+
+
+def bundle_create_cmd(args):
+    fatobjs = get_bundle_fatobjs(args.targets)
+    if args.output == "-":
+        fatrepo.create_bundle(fatobjs, sys.stdout.buffer)
+        return
+    with open(args.output, "wb") as output_handle:
+        fatrepo.create_bundle(fatobjs, output_handle)
+
+
+def bundle_unbundle_cmd(args):
+    if args.file == "-":
+        fatrepo.unbundle(sys.stdin.buffer)
+        return
+    with open(args.file, "rb") as input_handle:
+        fatrepo.unbundle(input_handle)
+
+
+def profile_report_cmd(args):
+    directory = args.directory or os.environ.get(PROFILE_ENV)
+    if not directory:
+        print(f"git-fat profile-report: pass a directory or set {PROFILE_ENV}", file=sys.stderr)
+        sys.exit(1)
+    profiles = list_profiles(Path(directory), args.command_filter)
+    if not profiles:
+        print(f"git-fat profile-report: no profiles in {directory}", file=sys.stderr)
+        sys.exit(1)
+    runs: Dict[str, int] = {}
+    for path in profiles:
+        command = profile_command(path)
+        runs[command] = runs.get(command, 0) + 1
+    print(f"{len(profiles)} profiles: " + ", ".join(f"{command} x{count}" for command, count in sorted(runs.items())))
+    print(merge_profiles(profiles, args.sort, args.limit), end="")
+
+
+def run_cmd(args):
+    global fatrepo
+    fatrepo = get_fatrepo()
+    return args.func(args)
 
 
 def main():
     parser = argparse.ArgumentParser(description="Large (fat) file manager for git")
     parser.add_argument("-v", "--version", action="store_true", help="Show package version")
-    subparsers = parser.add_subparsers()
+    subparsers = parser.add_subparsers(dest="command")
     pull_parser = subparsers.add_parser("pull", help="Download and restore large files from fatstore")
     pull_new_parser = subparsers.add_parser(
-        "pull-new", help="Download and restore large files new to given REF, defaults to master"
+        "pull-new",
+        help="Download and restore large files new to given REFs or BASE..TARGET ranges, defaults to master",
     )
-    pull_new_parser.add_argument("ref_name", nargs="?", default="master")
+    pull_new_parser.add_argument("ref_name", nargs="*", default=["master"])
     pull_parser.add_argument("-a", "--all", action="store_true", help="Download and restore all large files")
-    pull_parser.add_argument("files", nargs="*", help="List of files to download and restore")
+    pull_parser.add_argument(
+        "--all-history",
+        action="store_true",
+        help="Download all large files referenced by any REF, restore those in the index",
+    )
+    pull_parser.add_argument(
+        "--include", action="append", help="Also pull files matching glob (from repository root), repeatable"
+    )
+    pull_parser.add_argument(
+        "--exclude", action="append", help="Skip files matching glob (from repository root), repeatable"
+    )
+    pull_parser.add_argument("files", nargs="*", help="Files or git pathspecs to download and restore")
     push_parser = subparsers.add_parser("push", help="Upload large files to fatstore")
     init_parser = subparsers.add_parser("init", help="Configure fat clean and smudge filters for git")
     clean_parser = subparsers.add_parser(
         "filter-clean", help="Takes byte stream (STDIN) and spits out (STDOUT) corresponding fatstub"
     )
+    clean_parser.add_argument("path", nargs="?", help="Worktree path of the stream, lets unchanged files skip hashing")
+    add_parser = subparsers.add_parser(
+        "add", help="Stage files like git add, hashing and caching large files across all cores"
+    )
+    add_parser.add_argument("-j", "--jobs", type=int, help="Number of hashing processes (default: CPU count)")
+    add_parser.add_argument("pathspecs", nargs="+", help="Files, directories or git pathspecs to add")
     smudge_parser = subparsers.add_parser(
         "filter-smudge", help="Takes fatstub byte stream (STDIN) and spits out (STDOUT) corresponding bytes file"
     )
@@ -132,24 +298,97 @@ def main():
 
     fscheck_new_parser = subparsers.add_parser(
         "fscheck-new",
-        help="Checks added fatobjs to working tree vs given REF (default=master) are on remote fatstore",
+        help="Checks added fatobjs to working tree vs given REFs or BASE..TARGET ranges (default=master) are on "
+        "remote fatstore",
     )
-    fscheck_new_parser.add_argument("ref_name", nargs="?", default="master")
+    fscheck_new_parser.add_argument("ref_name", nargs="*", default=["master"])
     fspublish_new_parser = subparsers.add_parser(
         "fspublish-new",
-        help="Publish added fatobjs to HEAD vs given REF (default=master) are on remote smudge stroe",
+        help="Publish added fatobjs to HEAD vs given REFs or BASE..TARGET ranges (default=master) are on remote "
+        "smudge stroe",
     )
-    fspublish_new_parser.add_argument("ref_name", nargs="?", default="master")
+    fspublish_new_parser.add_argument("ref_name", nargs="*", default=["master"])
+
+    pre_push_parser = subparsers.add_parser(
+        "pre-push", help="Upload fatobjs introduced by pushed refs, reads git pre-push hook input on STDIN"
+    )
+    pre_push_parser.add_argument("remote", nargs="?", help="Name of the remote being pushed to")
+    pre_push_parser.add_argument("url", nargs="?", help="URL of the remote being pushed to")
+    remote_orphans_parser = subparsers.add_parser(
+        "remote-orphans", help="List fatstore objects not referenced in history of given REVs (default: all REFs)"
+    )
+    remote_orphans_parser.add_argument("revs", nargs="*", help="REVs or ranges passed to git rev-list")
+    prune_remote_parser = subparsers.add_parser(
+        "prune-remote", help="Delete fatstore objects not referenced by given REFs (default: prune_refs or all REFs)"
+    )
+    prune_remote_parser.add_argument(
+        "--ref", action="append", help="REF, glob (refs/heads/*) or rev-list option (--remotes=origin), repeatable"
+    )
+    prune_remote_parser.add_argument(
+        "--grace-days", type=float, help="Keep unreferenced objects younger than this (default: 14)"
+    )
+    prune_remote_parser.add_argument(
+        "-n", "--dry-run", action="store_true", help="Report objects and bytes that would be deleted"
+    )
+    find_parser = subparsers.add_parser(
+        "find", help="List paths that held blobs larger than THRESH_BYTES in history, as .gitattributes lines"
+    )
+    find_parser.add_argument("threshold", type=int, metavar="THRESH_BYTES")
+    find_parser.add_argument("revs", nargs="*", help="REVs or ranges passed to git rev-list (default: --all)")
+    import_history_parser = subparsers.add_parser(
+        "import-history", help="Rewrite history so blobs at paths with filter=fat become fat stubs (irreversible)"
+    )
+    import_history_parser.add_argument("--push", action="store_true", help="Upload imported objects to fatstore")
+    import_history_parser.add_argument("revs", nargs="*", help="REVs passed to git fast-export (default: --all)")
+    status_parser = subparsers.add_parser(
+        "status", help="Summarize stub-only files, orphaned cached objects and objects not pushed yet"
+    )
+    status_parser.add_argument(
+        "--remote", action="store_true", help="List the fatstore instead of using what is known about it locally"
+    )
+    status_parser.add_argument("-l", "--list", action="store_true", help="List paths and objects of each group")
+    profile_report_parser = subparsers.add_parser(
+        "profile-report", help=f"Merge cProfile files written with {PROFILE_ENV}=DIR into one sorted report"
+    )
+    profile_report_parser.add_argument("directory", nargs="?", help=f"Profile directory (default: ${PROFILE_ENV})")
+    profile_report_parser.add_argument(
+        "--command", dest="command_filter", action="append", help="Only merge runs of this subcommand, repeatable"
+    )
+    profile_report_parser.add_argument(
+        "--sort", default="cumulative", help="pstats sort key: cumulative, tottime, calls, ... (default: cumulative)"
+    )
+    profile_report_parser.add_argument("--limit", type=int, default=40, help="Number of functions to show")
+    bundle_parser = subparsers.add_parser("bundle", help="Export or import cached fat objects as a single archive")
+    bundle_subparsers = bundle_parser.add_subparsers(required=True)
+    bundle_create_parser = bundle_subparsers.add_parser(
+        "create", help="Write cached fat objects of given REFs or paths (default: index) to an archive"
+    )
+    bundle_create_parser.add_argument("-o", "--output", default="-", help="Archive file, defaults to STDOUT")
+    bundle_create_parser.add_argument("targets", nargs="*", help="REFs or paths to bundle fat objects of")
+    bundle_unbundle_parser = bundle_subparsers.add_parser(
+        "unbundle", help="Verify and import fat objects from an archive into the local cache"
+    )
+    bundle_unbundle_parser.add_argument("file", nargs="?", default="-", help="Archive file, defaults to STDIN")
 
     pull_parser.set_defaults(func=pull_cmd)
     pull_new_parser.set_defaults(func=pull_new_cmd)
     push_parser.set_defaults(func=push_cmd)
     init_parser.set_defaults(func=init_cmd)
     clean_parser.set_defaults(func=clean_cmd)
+    add_parser.set_defaults(func=add_cmd)
     smudge_parser.set_defaults(func=smudge_cmd)
     fscheck.set_defaults(func=fscheck_cmd)
     fscheck_new_parser.set_defaults(func=fscheck_new_cmd)
     fspublish_new_parser.set_defaults(func=fspublish_new_cmd)
+    pre_push_parser.set_defaults(func=pre_push_cmd)
+    remote_orphans_parser.set_defaults(func=remote_orphans_cmd)
+    prune_remote_parser.set_defaults(func=prune_remote_cmd)
+    find_parser.set_defaults(func=find_cmd)
+    import_history_parser.set_defaults(func=import_history_cmd)
+    status_parser.set_defaults(func=status_cmd)
+    profile_report_parser.set_defaults(func=profile_report_cmd)
+    bundle_create_parser.set_defaults(func=bundle_create_cmd)
+    bundle_unbundle_parser.set_defaults(func=bundle_unbundle_cmd)
 
     if len(sys.argv) == 1:
         parser.print_help(sys.stderr)
@@ -160,9 +399,12 @@ def main():
         print(__version__)
         sys.exit(0)
 
-    global fatrepo
-    fatrepo = get_fatrepo()
-    args.func(args)
+    tracing.set_command(args.command)
+    profile_directory = os.environ.get(PROFILE_ENV)
+    if profile_directory and args.command != "profile-report":
+        run_profiled(Path(profile_directory), args.command, lambda: run_cmd(args))
+    else:
+        run_cmd(args)
 
 
 if __name__ == "__main__":
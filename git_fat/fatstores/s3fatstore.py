@@ -1,13 +1,20 @@
-from typing import List, Dict
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Tuple
 import boto3
 import os
 from .syncbackend import SyncBackend
+from .throttle import Throttle
 from botocore.config import Config
+from botocore.exceptions import ClientError
 from git_fat.tools import dryrun
+from git_fat.tracing import span
 from urllib3.exceptions import InsecureRequestWarning
 from urllib3 import disable_warnings
 
 
+DELETE_BATCH_SIZE = 1000
+
+
 def get_predictable_prefix(prefix: str):
     if not prefix:
         return prefix
@@ -33,6 +40,7 @@ class S3FatStore(SyncBackend):
         self.prefix = get_predictable_prefix(conf.get("prefix", ""))
         self.conf = conf
 
+        self.throttle = Throttle.from_conf(conf)
         self.s3 = self.get_s3_resource()
         self.bucket = self.s3.Bucket(self.bucket_name)
         disable_warnings(InsecureRequestWarning)
@@ -54,7 +62,9 @@ class S3FatStore(SyncBackend):
             named_args["aws_access_key_id"] = self.conf.get("id")  # pragma: no cover
             named_args["aws_secret_access_key"] = self.conf.get("secret")  # pragma: no cover
 
-        return boto3.resource("s3", config=Config(signature_version="s3v4"), verify=False, **named_args)
+        # retries are left to self.throttle, so throttling also slows down the other threads
+        config = Config(signature_version="s3v4", retries={"mode": "standard", "max_attempts": 1})
+        return boto3.resource("s3", config=config, verify=False, **named_args)
 
     @dryrun()
     def _upload(self, local_filename, remote_filename, **xargs):
@@ -73,28 +83,89 @@ class S3FatStore(SyncBackend):
             remote_filename = os.path.basename(local_filename)
         if self.prefix:
             remote_filename = os.path.join(self.prefix, remote_filename)
-        self._upload(local_filename, remote_filename, **xargs)
+        size = os.path.getsize(local_filename)
+        with span("s3.upload", bytes=size, count=1):
+            self.throttle.call(
+                "upload",
+                "write",
+                self.strip_prefix(remote_filename),
+                lambda: self._upload(local_filename, remote_filename, **xargs),
+                size,
+            )
 
     def strip_prefix(self, identifier):
         if identifier.startswith(self.prefix) and self.prefix:
             return identifier[len(self.prefix) :]
         return identifier
 
-    def list(self) -> List[str]:
-        if self.prefix:
-            remote_objs = self.bucket.objects.filter(Prefix=self.prefix).all()
-        else:
-            remote_objs = self.bucket.objects.all()
-        remote_files = [self.strip_prefix(item.key) for item in remote_objs]
-        return remote_files
+    def list(self, prefix: str = "") -> List[str]:
+        return [remote_file for remote_file, _, _ in self.list_details(prefix)]
+
+    def list_details(self, prefix: str = "") -> Iterator[Tuple[str, int, datetime]]:
+        """
+        Yields (name, size, last modified) of remote files starting with prefix, one listing page at a time
+        """
+        client = self.s3.meta.client
+        request = {"Bucket": self.bucket_name, "Prefix": self.prefix + prefix}
+        with span("s3.list") as listing:
+            while True:
+                page = self.throttle.call("list", "read", prefix, lambda: client.list_objects_v2(**request))
+                for item in page.get("Contents", []):
+                    listing.count += 1
+                    yield self.strip_prefix(item["Key"]), item["Size"], item["LastModified"]
+                if not page.get("IsTruncated"):
+                    break
+                request["ContinuationToken"] = page["NextContinuationToken"]
+
+    def exists(self, remote_filename: str) -> bool:
+        """
+        Returns true if remote file exists, probed with a single HEAD request
+        """
+        key = os.path.join(self.prefix, remote_filename) if self.prefix else remote_filename
+        try:
+            with span("s3.exists", count=1):
+                self.head(remote_filename, key)
+            return True
+        except ClientError as error:
+            if error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def head(self, remote_filename: str, key: str) -> Dict:
+        """
+        Returns the HEAD response of remote file, key is remote_filename with the store prefix
+        """
+        client = self.s3.meta.client
+        return self.throttle.call(
+            "head", "read", remote_filename, lambda: client.head_object(Bucket=self.bucket_name, Key=key)
+        )
 
     def download(self, remote_filename: str, local_filename: os.PathLike) -> None:
-        if self.prefix:
-            remote_filename = os.path.join(self.prefix, remote_filename)
-        s3_object = self.bucket.Object(remote_filename)
-        last_modified = s3_object.last_modified
-        self.bucket.download_file(remote_filename, local_filename)
-        os.utime(local_filename, (os.stat(local_filename).st_atime, last_modified.timestamp()))
+        key = os.path.join(self.prefix, remote_filename) if self.prefix else remote_filename
+        with span("s3.download", count=1) as download:
+            head = self.head(remote_filename, key)
+            download.bytes = head["ContentLength"]
+            self.throttle.call(
+                "download",
+                "read",
+                remote_filename,
+                lambda: self.bucket.download_file(key, str(local_filename)),
+                download.bytes,
+            )
+        os.utime(local_filename, (os.stat(local_filename).st_atime, head["LastModified"].timestamp()))
+
+    def download_range(self, remote_filename: str, start: int, end: int) -> bytes:
+        """
+        Returns bytes [start, end) of remote file using a single ranged GET
+        """
+        key = os.path.join(self.prefix, remote_filename) if self.prefix else remote_filename
+
+        def get_range() -> bytes:
+            response = self.bucket.Object(key).get(Range=f"bytes={start}-{end - 1}")
+            return response["Body"].read()
+
+        with span("s3.download_range", bytes=end - start, count=1):
+            return self.throttle.call("download_range", "read", remote_filename, get_range, end - start)
 
     def delete(self, filename: str) -> None:
         if self.prefix:
@@ -102,4 +173,28 @@ class S3FatStore(SyncBackend):
         else:
             remote_fname = filename
         s3_object = self.bucket.Object(remote_fname)
-        s3_object.delete()
+        self.throttle.call("delete", "write", filename, s3_object.delete)
+
+    @dryrun(return_value=[])
+    def _delete_objects(self, keys: List[str]) -> List[str]:
+        request = {"Objects": [{"Key": key} for key in keys], "Quiet": True}
+        with span("s3.delete", count=len(keys)):
+            response = self.throttle.call(
+                "delete", "write", self.strip_prefix(keys[0]), lambda: self.bucket.delete_objects(Delete=request)
+            )
+        return [self.strip_prefix(error["Key"]) for error in response.get("Errors", [])]
+
+    def delete_many(self, filenames: Iterable[str]) -> List[str]:
+        """
+        Deletes remote files with batched DeleteObjects requests, returns names that failed to delete
+        """
+        failed = []
+        batch: List[str] = []
+        for filename in filenames:
+            batch.append(os.path.join(self.prefix, filename) if self.prefix else filename)
+            if len(batch) == DELETE_BATCH_SIZE:
+                failed.extend(self._delete_objects(batch))
+                batch = []
+        if batch:
+            failed.extend(self._delete_objects(batch))
+        return failed
@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
-from typing import List
+from datetime import datetime
+from typing import Iterable, Iterator, List, Tuple
 import os
 
 
@@ -9,13 +10,29 @@ class SyncBackend(ABC):
         pass
 
     @abstractmethod
-    def list(self) -> List[str]:
+    def list(self, prefix: str = "") -> List[str]:
+        pass
+
+    @abstractmethod
+    def list_details(self, prefix: str = "") -> Iterator[Tuple[str, int, datetime]]:
+        pass
+
+    @abstractmethod
+    def exists(self, remote_filename: str) -> bool:
         pass
 
     @abstractmethod
     def download(self, remote_filename: str, local_filename: os.PathLike) -> None:
         pass
 
+    @abstractmethod
+    def download_range(self, remote_filename: str, start: int, end: int) -> bytes:
+        pass
+
     @abstractmethod
     def delete(self, filename: str) -> None:
         pass
+
+    @abstractmethod
+    def delete_many(self, filenames: Iterable[str]) -> List[str]:
+        pass
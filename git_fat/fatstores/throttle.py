@@ -0,0 +1,238 @@
+"""
+Adaptive concurrency for fatstore requests: an AIMD limiter on throttle and latency signals, jittered retry
+backoff and per key prefix request budgets, so transfers settle near the rate the store accepts instead of
+every thread hammering it with retries.
+"""
+
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional, TypeVar
+
+from boto3.exceptions import S3UploadFailedError
+from botocore.exceptions import ClientError, ConnectionError, ReadTimeoutError
+
+T = TypeVar("T")
+
+THROTTLE_CODES = {
+    "SlowDown",
+    "Throttling",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+    "TooManyRequestsException",
+    "ServiceUnavailable",
+    "503",
+}
+TRANSIENT_CODES = {"InternalError", "RequestTimeout", "500", "502", "504"}
+THROTTLE_STATUS = {429, 503}
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_MAX_CONCURRENCY = 64
+DEFAULT_ATTEMPTS = 8
+BACKOFF_BASE = 0.1
+BACKOFF_CAP = 20.0
+# a request this many times slower than the best recent one counts as congestion
+LATENCY_FACTOR = 4.0
+LATENCY_SMOOTHING = 0.2
+# S3 accepts at least this many requests per second and partitioned prefix
+READ_BUDGET = 5500
+WRITE_BUDGET = 3500
+MIB = 1024 * 1024
+
+
+def error_code(error: ClientError) -> str:
+    return str(error.response.get("Error", {}).get("Code", ""))
+
+
+def unwrap_error(error: Exception) -> Exception:
+    """
+    Returns the ClientError behind boto3's upload_file S3UploadFailedError, which only keeps it as context
+    """
+    if isinstance(error, S3UploadFailedError) and isinstance(error.__context__, ClientError):
+        return error.__context__
+    return error
+
+
+def is_throttle(error: Exception) -> bool:
+    error = unwrap_error(error)
+    if isinstance(error, ClientError):
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        return error_code(error) in THROTTLE_CODES or status in THROTTLE_STATUS
+    return isinstance(error, ReadTimeoutError)
+
+
+def is_retryable(error: Exception) -> bool:
+    error = unwrap_error(error)
+    if isinstance(error, ClientError):
+        return is_throttle(error) or error_code(error) in TRANSIENT_CODES
+    return isinstance(error, (ConnectionError, ReadTimeoutError))
+
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP, rng=random.random) -> float:
+    """
+    Returns a "full jitter" delay, uniform in [0, min(cap, base * 2^attempt)], so throttled clients spread out
+    """
+    return rng() * min(cap, base * 2**attempt)
+
+
+class AdaptiveLimiter:
+    """
+    Bounds in-flight requests to a limit that grows by one per limit successes (additive increase) and halves on
+    congestion (multiplicative decrease). Like TCP, requests sent before the last decrease don't decrease it again,
+    so one burst of errors counts once, and the limit only grows while it is actually used up.
+    """
+
+    def __init__(
+        self,
+        initial: int = DEFAULT_CONCURRENCY,
+        maximum: int = DEFAULT_MAX_CONCURRENCY,
+        minimum: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.clock = clock
+        self.active = 0
+        self.last_decrease = float("-inf")
+        self.condition = threading.Condition()
+
+    def acquire(self) -> float:
+        """
+        Waits for a free slot, returns when it was taken, to be passed to on_success or on_congestion
+        """
+        with self.condition:
+            while self.active >= int(self.limit):
+                self.condition.wait()
+            self.active += 1
+            return self.clock()
+
+    def release(self) -> None:
+        with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    def on_success(self) -> None:
+        with self.condition:
+            if self.active + 1 >= int(self.limit):
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                self.condition.notify_all()
+
+    def on_congestion(self, started: float) -> None:
+        with self.condition:
+            if started <= self.last_decrease:
+                return
+            self.last_decrease = self.clock()
+            self.limit = max(self.minimum, self.limit / 2)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.tokens = rate
+        self.clock = clock
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Takes a token, returns how long to wait until it is actually available
+        """
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class Throttle:
+    """
+    Runs fatstore requests through the adaptive limiter, request budgets of their key prefix and retries
+        Parameters:
+            prefix_length: characters of a key (after the store prefix) that name its budget partition
+    """
+
+    def __init__(
+        self,
+        limiter: Optional[AdaptiveLimiter] = None,
+        read_budget: float = READ_BUDGET,
+        write_budget: float = WRITE_BUDGET,
+        prefix_length: int = 0,
+        attempts: int = DEFAULT_ATTEMPTS,
+        sleep: Callable[[float], None] = time.sleep,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.limiter = limiter or AdaptiveLimiter(clock=clock)
+        self.budgets = {"read": read_budget, "write": write_budget}
+        self.prefix_length = prefix_length
+        self.attempts = attempts
+        self.sleep = sleep
+        self.clock = clock
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.best_latency: Dict[str, float] = {}
+        self.latency: Dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_conf(cls, conf: Dict) -> "Throttle":
+        concurrency = int(conf.get("concurrency", DEFAULT_CONCURRENCY))
+        limiter = AdaptiveLimiter(concurrency, int(conf.get("max_concurrency", DEFAULT_MAX_CONCURRENCY)))
+        return cls(
+            limiter,
+            read_budget=float(conf.get("read_budget", READ_BUDGET)),
+            write_budget=float(conf.get("write_budget", WRITE_BUDGET)),
+            prefix_length=int(conf.get("budget_prefix_length", 0)),
+            attempts=int(conf.get("attempts", DEFAULT_ATTEMPTS)),
+        )
+
+    def wait_for_budget(self, kind: str, key: str) -> None:
+        partition = f"{kind}:{key[: self.prefix_length]}"
+        with self.lock:
+            bucket = self.buckets.get(partition)
+            if bucket is None:
+                bucket = self.buckets[partition] = TokenBucket(self.budgets[kind], self.clock)
+        delay = bucket.reserve()
+        if delay:
+            self.sleep(delay)
+
+    def is_slow(self, operation: str, seconds: float, size: int) -> bool:
+        """
+        Tracks smoothed latency per operation, normalized per MiB for transfers so object size isn't congestion
+        """
+        normalized = seconds / max(1.0, size / MIB)
+        with self.lock:
+            average = self.latency.get(operation, normalized)
+            average += LATENCY_SMOOTHING * (normalized - average)
+            self.latency[operation] = average
+            best = self.best_latency[operation] = min(self.best_latency.get(operation, average), average)
+        return average > best * LATENCY_FACTOR
+
+    def call(self, operation: str, kind: str, key: str, func: Callable[[], T], size: int = 0) -> T:
+        """
+        Returns func(), retried with jittered backoff on throttling and transient errors
+            Parameters:
+                kind: "read" or "write", which request budget of the key prefix it spends
+        """
+        attempt = 0
+        while True:
+            self.wait_for_budget(kind, key)
+            start = self.limiter.acquire()
+            try:
+                result = func()
+            except Exception as error:
+                self.limiter.release()
+                if is_throttle(error):
+                    self.limiter.on_congestion(start)
+                attempt += 1
+                if not is_retryable(error) or attempt >= self.attempts:
+                    raise
+                self.sleep(backoff_delay(attempt))
+                continue
+            if self.is_slow(operation, self.clock() - start, size):
+                self.limiter.release()
+                self.limiter.on_congestion(start)
+            else:
+                self.limiter.on_success()
+                self.limiter.release()
+            return result
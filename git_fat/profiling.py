@@ -0,0 +1,65 @@
+"""
+Opt-in cProfile of whole git-fat runs, including filters spawned by git: with GIT_FAT_PROFILE=DIR every
+command writes DIR/<command>-<pid>-<start ns>-<object id>.pstats, merged by `git fat profile-report`.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import time
+from pathlib import Path
+from typing import Callable, List, Optional
+
+PROFILE_ENV = "GIT_FAT_PROFILE"
+PROFILE_SUFFIX = ".pstats"
+
+
+def profile_path(directory: Path, command: str, object_id: Optional[str]) -> Path:
+    """
+    Returns a profile file name unique to this process run, I.E. filter-clean-4242-1700000000000000000-<fatid>
+    """
+    return directory / f"{command}-{os.getpid()}-{time.time_ns()}-{object_id or 'none'}{PROFILE_SUFFIX}"
+
+
+def run_profiled(directory: Path, command: str, func: Callable[[], Optional[str]]) -> Optional[str]:
+    """
+    Runs func under cProfile and dumps the stats even if it exits early, func returns the object id it handled
+    """
+    profiler = cProfile.Profile()
+    object_id = None
+    try:
+        object_id = profiler.runcall(func)
+        return object_id
+    finally:
+        directory.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(str(profile_path(directory, command, object_id)))
+
+
+def profile_command(path: Path) -> str:
+    """
+    Returns the subcommand a profile file was written by
+    """
+    return path.name.rsplit("-", 3)[0]
+
+
+def list_profiles(directory: Path, commands: Optional[List[str]] = None) -> List[Path]:
+    """
+    Returns profile files in directory, limited to the given commands
+    """
+    profiles = sorted(directory.glob(f"*{PROFILE_SUFFIX}"))
+    if commands:
+        profiles = [path for path in profiles if profile_command(path) in commands]
+    return profiles
+
+
+def merge_profiles(profiles: List[Path], sort: str = "cumulative", limit: int = 40) -> str:
+    """
+    Returns one pstats report of the given profile files, sorted by the given pstats key
+    """
+    output = io.StringIO()
+    stats = pstats.Stats(str(profiles[0]), stream=output)
+    for path in profiles[1:]:
+        stats.add(str(path))
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return output.getvalue()
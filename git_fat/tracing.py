@@ -0,0 +1,195 @@
+"""
+Spans with durations, bytes and item counts around git-fat hot paths, enabled by GIT_FAT_TRACE.
+
+GIT_FAT_TRACE is a comma separated list of outputs written when the command exits:
+    summary                 table of spans on STDERR
+    chrome:PATH             Chrome trace event JSON (chrome://tracing, ui.perfetto.dev)
+    prometheus:PATH         Prometheus textfile, for the node exporter textfile collector
+{command} and {pid} in PATH are replaced, filters run once per file so give them distinct names.
+"""
+
+import atexit
+import functools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+TRACE_ENV = "GIT_FAT_TRACE"
+MIB = 1024 * 1024
+
+
+class Span:
+    """
+    Times a with block, callers add to bytes and count while it runs
+    """
+
+    __slots__ = ("tracer", "name", "bytes", "count", "start_ns", "duration_ns", "thread")
+
+    def __init__(self, tracer: Optional["Tracer"], name: str, bytes: int = 0, count: int = 0):
+        self.tracer = tracer
+        self.name = name
+        self.bytes = bytes
+        self.count = count
+        self.start_ns = 0
+        self.duration_ns = 0
+        self.thread = 0
+
+    def __enter__(self) -> "Span":
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *_) -> None:
+        if self.tracer is not None:
+            self.duration_ns = time.perf_counter_ns() - self.start_ns
+            self.thread = threading.get_ident()
+            self.tracer.spans.append(self)
+
+
+class Tracer:
+    def __init__(self, outputs: List[Tuple[str, str]]):
+        self.outputs = outputs
+        self.spans: List[Span] = []
+        self.command = "git-fat"
+        self.start_ns = time.perf_counter_ns()
+        self.start_time = time.time()
+
+    def totals(self) -> Dict[str, List[int]]:
+        """
+        Returns [calls, duration_ns, bytes, count] per span name
+        """
+        totals: Dict[str, List[int]] = {}
+        for span in self.spans:
+            total = totals.setdefault(span.name, [0, 0, 0, 0])
+            total[0] += 1
+            total[1] += span.duration_ns
+            total[2] += span.bytes
+            total[3] += span.count
+        return totals
+
+    def summary(self) -> str:
+        lines = ["%-28s %8s %10s %14s %10s %10s" % ("span", "calls", "seconds", "bytes", "items", "MiB/s")]
+        ordered = sorted(self.totals().items(), key=lambda item: item[1][1], reverse=True)
+        for name, (calls, duration_ns, nbytes, count) in ordered:
+            seconds = duration_ns / 1e9
+            rate = "%10.1f" % (nbytes / MIB / seconds) if nbytes and seconds else "%10s" % "-"
+            lines.append("%-28s %8d %10.3f %14d %10d %s" % (name, calls, seconds, nbytes, count, rate))
+        return "\n".join(lines) + "\n"
+
+    def chrome_trace(self) -> dict:
+        pid = os.getpid()
+        events = [
+            {
+                "name": span.name,
+                "cat": self.command,
+                "ph": "X",
+                "ts": (span.start_ns - self.start_ns) / 1000,
+                "dur": span.duration_ns / 1000,
+                "pid": pid,
+                "tid": span.thread,
+                "args": {"bytes": span.bytes, "count": span.count},
+            }
+            for span in self.spans
+        ]
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"command": self.command}}
+
+    def prometheus(self) -> str:
+        metrics = [
+            ("git_fat_span_calls", "Number of times the span ran in the last run"),
+            ("git_fat_span_seconds", "Seconds spent in the span in the last run"),
+            ("git_fat_span_bytes", "Bytes processed by the span in the last run"),
+            ("git_fat_span_items", "Items (files, objects, keys) processed by the span in the last run"),
+        ]
+        totals = self.totals()
+        lines = []
+        for index, (metric, description) in enumerate(metrics):
+            lines += [f"# HELP {metric} {description}", f"# TYPE {metric} gauge"]
+            for name, total in sorted(totals.items()):
+                value = total[index] / 1e9 if metric == "git_fat_span_seconds" else total[index]
+                lines.append(f'{metric}{{command="{self.command}",span="{name}"}} {value}')
+        lines += [
+            "# HELP git_fat_last_run_timestamp_seconds Unix time the last run started",
+            "# TYPE git_fat_last_run_timestamp_seconds gauge",
+            f'git_fat_last_run_timestamp_seconds{{command="{self.command}"}} {self.start_time}',
+        ]
+        return "\n".join(lines) + "\n"
+
+    def output_path(self, template: str) -> str:
+        return template.replace("{command}", self.command).replace("{pid}", str(os.getpid()))
+
+    def write(self, path: str, data: str) -> None:
+        """
+        Writes through a temporary file and rename, the textfile collector must never read partial files
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmpfile_path = tempfile.mkstemp(dir=directory, prefix=".git-fat-trace")
+        with os.fdopen(fd, "w") as tmpfile_handle:
+            tmpfile_handle.write(data)
+        os.replace(tmpfile_path, path)
+
+    def report(self) -> None:
+        for kind, target in self.outputs:
+            if kind == "summary":
+                print(f"git-fat {self.command} trace:", file=sys.stderr)
+                print(self.summary(), end="", file=sys.stderr)
+            elif kind == "chrome":
+                self.write(self.output_path(target), json.dumps(self.chrome_trace()))
+            elif kind == "prometheus":
+                self.write(self.output_path(target), self.prometheus())
+
+
+def parse_outputs(value: str) -> List[Tuple[str, str]]:
+    outputs = []
+    for output in filter(None, (part.strip() for part in value.split(","))):
+        kind, _, target = output.partition(":")
+        if kind not in ("summary", "chrome", "prometheus") or (kind != "summary" and not target):
+            print(f"git-fat: ignoring unknown {TRACE_ENV} output {output!r}", file=sys.stderr)
+            continue
+        outputs.append((kind, target))
+    return outputs
+
+
+def get_tracer() -> Optional[Tracer]:
+    outputs = parse_outputs(os.environ.get(TRACE_ENV, ""))
+    if not outputs:
+        return None
+    tracer = Tracer(outputs)
+    atexit.register(tracer.report)
+    return tracer
+
+
+_tracer = get_tracer()
+
+
+def span(name: str, bytes: int = 0, count: int = 0) -> Span:
+    """
+    Returns a span recorded when tracing is enabled, I.E. with span("s3.download") as s: ...; s.bytes = size
+    """
+    return Span(_tracer, name, bytes, count)
+
+
+def traced(name: str) -> Callable:
+    """
+    Decorator recording a span per call, sized results set its item count
+    """
+
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name) as current:
+                result = function(*args, **kwargs)
+                if hasattr(result, "__len__"):
+                    current.count = len(result)
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+def set_command(command: str) -> None:
+    if _tracer is not None:
+        _tracer.command = command
@@ -0,0 +1,34 @@
+import hashlib
+from pathlib import Path
+from typing import List, Tuple
+
+BUNDLE_INDEX = "git-fat-bundle.idx"
+BUNDLE_OBJECTS = "objects/"
+
+BundleEntry = Tuple[str, int, str]
+
+
+def file_sha1(path: Path, block_size: int = 1024 * 1024) -> str:
+    sha = hashlib.sha1()
+    with open(path, "rb") as handle:
+        while True:
+            block = handle.read(block_size)
+            if not block:
+                break
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def encode_bundle_index(entries: List[BundleEntry]) -> bytes:
+    """
+    Returns bundle index bytes, one "name size sha1" line per cached file in the bundle
+    """
+    return "".join("%s %d %s\n" % entry for entry in entries).encode()
+
+
+def decode_bundle_index(data: bytes) -> List[BundleEntry]:
+    entries = []
+    for line in data.decode().splitlines():
+        name, size, checksum = line.split()
+        entries.append((name, int(size), checksum))
+    return entries
@@ -0,0 +1,105 @@
+import hashlib
+from typing import Iterable, Iterator, List, Tuple
+
+RECIPE_SUFFIX = ".recipe"
+RECIPE_COOKIE = b"#$# git-fat-recipe"
+
+DEFAULT_MIN_SIZE = 256 * 1024
+DEFAULT_AVG_SIZE = 1024 * 1024
+DEFAULT_MAX_SIZE = 4 * 1024 * 1024
+
+HASH_BITS = 32
+HASH_MASK = (1 << HASH_BITS) - 1
+
+
+def _gear_table() -> List[int]:
+    """
+    Returns 256 pseudo random 32 bit integers used by the gear rolling hash, derived from sha1 so that
+    chunk boundaries are stable across python versions and platforms
+    """
+    return [int.from_bytes(hashlib.sha1(bytes([i])).digest()[:4], "big") for i in range(256)]
+
+
+GEAR = _gear_table()
+
+
+def _mask(bits: int) -> int:
+    bits = max(1, min(bits, HASH_BITS))
+    return ((1 << bits) - 1) << (HASH_BITS - bits)
+
+
+def find_cut(data: bytearray, min_size: int, avg_size: int, max_size: int) -> int:
+    """
+    Returns the length of the next content defined chunk in data (FastCDC normalized chunking)
+        Parameters:
+            data: buffered bytes, chunk always starts at offset 0
+    """
+    length = min(len(data), max_size)
+    if length <= min_size:
+        return length
+
+    bits = avg_size.bit_length() - 1
+    strict_mask = _mask(bits + 1)
+    loose_mask = _mask(bits - 1)
+    normal_size = min(avg_size, length)
+
+    gear = GEAR
+    h = 0
+    for i in range(min_size, normal_size):
+        h = ((h << 1) + gear[data[i]]) & HASH_MASK
+        if not h & strict_mask:
+            return i + 1
+    for i in range(normal_size, length):
+        h = ((h << 1) + gear[data[i]]) & HASH_MASK
+        if not h & loose_mask:
+            return i + 1
+    return length
+
+
+def iter_chunks(
+    blocks: Iterable[bytes],
+    min_size: int = DEFAULT_MIN_SIZE,
+    avg_size: int = DEFAULT_AVG_SIZE,
+    max_size: int = DEFAULT_MAX_SIZE,
+) -> Iterator[bytes]:
+    """
+    Takes an iterable of byte blocks, yields content defined chunks. Cut points only depend on content,
+    never on how the input stream was split into blocks.
+    """
+    buffer = bytearray()
+    for block in blocks:
+        buffer += block
+        while len(buffer) >= max_size:
+            cut = find_cut(buffer, min_size, avg_size, max_size)
+            yield bytes(buffer[:cut])
+            del buffer[:cut]
+
+    while buffer:
+        cut = find_cut(buffer, min_size, avg_size, max_size)
+        yield bytes(buffer[:cut])
+        del buffer[:cut]
+
+
+def encode_recipe(fatid: str, size: int, chunks: List[Tuple[str, int]]) -> bytes:
+    """
+    Returns recipe bytes describing how to reassemble fat object (fatid) from its chunks
+    I.E. #$# git-fat-recipe file_hex_digest file_size, followed by one "chunk_hex_digest chunk_size" per line
+    """
+    lines = ["%s %s %d" % (RECIPE_COOKIE.decode(), fatid, size)]
+    lines.extend("%s %d" % (chunkid, chunk_size) for chunkid, chunk_size in chunks)
+    return ("\n".join(lines) + "\n").encode()
+
+
+def decode_recipe(data: bytes) -> Tuple[str, int, List[Tuple[str, int]]]:
+    """
+    Returns the fatid, size and ordered list of (chunkid, size) stored in recipe bytes
+    """
+    lines = data.decode().splitlines()
+    if not lines or not lines[0].startswith(RECIPE_COOKIE.decode()):
+        raise ValueError("Not a git-fat recipe")
+    fatid, size = lines[0][len(RECIPE_COOKIE) :].split()
+    chunks = []
+    for line in lines[1:]:
+        chunkid, chunk_size = line.split()
+        chunks.append((chunkid, int(chunk_size)))
+    return fatid, int(size), chunks
@@ -1,4 +1,5 @@
 import os
+import shutil
 
 
 def umask():
@@ -24,3 +25,28 @@ def tobytes(s, encoding="utf8") -> bytes:
     if hasattr(s, "encode"):
         return s.encode(encoding)
     raise ValueError("Could not encode")
+
+
+FICLONE = 0x40049409
+
+
+def clone_file(source, destination):
+    """Copy file contents, sharing extents (reflink) when the filesystem supports it"""
+    try:
+        import fcntl
+
+        with open(source, "rb") as source_handle, open(destination, "wb") as destination_handle:
+            fcntl.ioctl(destination_handle.fileno(), FICLONE, source_handle.fileno())
+        return
+    except (ImportError, OSError):
+        pass
+    shutil.copyfile(source, destination)
+
+
+def human_size(size: float) -> str:
+    """Format a byte count, I.E. 1536 -> 1.5 KiB"""
+    for unit in ["B", "KiB", "MiB", "GiB", "TiB"]:
+        if size < 1024 or unit == "TiB":
+            break
+        size /= 1024
+    return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
@@ -0,0 +1,114 @@
+import codecs
+import subprocess
+from pathlib import Path
+from typing import IO, Callable, Dict, List, Optional
+
+REGULAR_MODES = {b"100644", b"100755"}
+COPY_SIZE = 1024 * 1024
+
+
+def unquote_path(path: bytes) -> bytes:
+    """
+    Returns a path as written by git fast-export without its C-style quoting, I.E. "a\\"b" -> a"b
+    """
+    if path.startswith(b'"') and path.endswith(b'"'):
+        return codecs.escape_decode(path[1:-1])[0]  # type: ignore
+    return path
+
+
+def rewrite_fast_export(
+    input_handle: IO, output_handle: IO, replace_blob: Callable[[str, bytes], Optional[str]]
+) -> None:
+    """
+    Copies a `git fast-export --no-data` stream, passing the blob sha and path of every regular file
+    modification (M) to replace_blob, which returns the sha of the blob to use instead or None to keep it.
+    data blocks (commit and tag messages) are copied verbatim.
+    """
+    while True:
+        line = input_handle.readline()
+        if not line:
+            break
+        if line.startswith(b"data "):
+            output_handle.write(line)
+            remaining = int(line[5:])
+            while remaining:
+                block = input_handle.read(min(remaining, COPY_SIZE))
+                if not block:
+                    raise EOFError("Truncated data block in fast-export stream")
+                output_handle.write(block)
+                remaining -= len(block)
+            continue
+        if line.startswith(b"M "):
+            mode, dataref, path = line[2:].rstrip(b"\n").split(b" ", 2)
+            if mode in REGULAR_MODES and not dataref.startswith(b":"):
+                replacement = replace_blob(dataref.decode(), unquote_path(path))
+                if replacement:
+                    line = b"M %s %s %s\n" % (mode, replacement.encode(), path)
+        output_handle.write(line)
+
+
+def rewrite_history(repo_dir: Path, rev_args: List[str], replace_blob: Callable[[str, bytes], Optional[str]]) -> bool:
+    """
+    Rewrites history of rev_args by piping `git fast-export` through rewrite_fast_export into `git fast-import`,
+    which force updates the rewritten refs. Returns true on success.
+    """
+    fast_export = subprocess.Popen(
+        ["git", "fast-export", "--no-data", "--signed-tags=strip", "--tag-of-filtered-object=rewrite", *rev_args],
+        cwd=str(repo_dir),
+        stdout=subprocess.PIPE,
+    )
+    fast_import = subprocess.Popen(
+        ["git", "fast-import", "--force", "--quiet"], cwd=str(repo_dir), stdin=subprocess.PIPE
+    )
+    try:
+        rewrite_fast_export(fast_export.stdout, fast_import.stdin, replace_blob)
+    finally:
+        fast_import.stdin.close()  # type: ignore
+    return fast_export.wait() == 0 and fast_import.wait() == 0
+
+
+class AttributeChecker:
+    """
+    Answers `git check-attr` queries for one attribute through a single long running process,
+    each path is only asked once
+    """
+
+    def __init__(self, repo_dir: Path, attribute: str):
+        self.attribute = attribute
+        self.process = subprocess.Popen(
+            ["git", "check-attr", "-z", "--stdin", attribute],
+            cwd=str(repo_dir),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        self.values: Dict[bytes, str] = {}
+        self.buffer = b""
+
+    def read_field(self) -> bytes:
+        while b"\0" not in self.buffer:
+            block = self.process.stdout.read1(COPY_SIZE)  # type: ignore
+            if not block:
+                raise EOFError("git check-attr exited early")
+            self.buffer += block
+        field, self.buffer = self.buffer.split(b"\0", 1)
+        return field
+
+    def get(self, path: bytes) -> str:
+        if path not in self.values:
+            self.process.stdin.write(path + b"\0")  # type: ignore
+            self.process.stdin.flush()  # type: ignore
+            # answers come back as path, attribute, value
+            self.read_field()
+            self.read_field()
+            self.values[path] = self.read_field().decode()
+        return self.values[path]
+
+    def close(self) -> None:
+        self.process.stdin.close()  # type: ignore
+        self.process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
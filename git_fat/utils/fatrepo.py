@@ -1,22 +1,66 @@
 from git.repo import Repo
-from git import Commit
+from git import Commit, GitCommandError
 from git.objects.base import Object as Gobject
 from functools import singledispatchmethod
 import git.objects
 from pathlib import Path
 from git_fat.fatstores import S3FatStore
+from git_fat.fatstores.s3fatstore import DELETE_BATCH_SIZE
+from git_fat.tracing import span, traced
 from .fatobj import FatObj
-from .common import tostr, tobytes, umask
+from .fatstatus import FatStatus
+from .common import tostr, tobytes, umask, clone_file
 from .noargs import NoArgs
+from .chunking import (
+    RECIPE_SUFFIX,
+    DEFAULT_MIN_SIZE,
+    DEFAULT_AVG_SIZE,
+    DEFAULT_MAX_SIZE,
+    iter_chunks,
+    encode_recipe,
+    decode_recipe,
+)
+from .packing import (
+    INDEX_SUFFIX,
+    PACK_PREFIX,
+    PACK_SUFFIX,
+    PackEntry,
+    is_pack_index,
+    pack_name,
+    decode_pack_index,
+    group_for_packing,
+    write_pack,
+    coalesce_ranges,
+)
 import hashlib
-from typing import List, Set, Tuple, IO, Union
+from typing import Dict, Iterator, List, Optional, Set, Tuple, IO, Union
+from .revwalk import iter_objects, read_blobs, batch_check, existing_objects
+from .bundle import BUNDLE_INDEX, BUNDLE_OBJECTS, BundleEntry, file_sha1, encode_bundle_index, decode_bundle_index
+from .fastexport import AttributeChecker, rewrite_history
+from .hashcopy import BUFFER_SIZE, hash_copy_stream, hash_copy_file
+from .statcache import STAT_CACHE, StatEntry, stat_entry, is_stat_match, is_racy, encode_stat_entry, decode_stat_cache
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from gitdb import IStream
+from datetime import datetime, timedelta, timezone
+import subprocess
+import tarfile
+import threading
+import io
 import tomli
 import tempfile
 import os
 import sys
 import shutil
+import stat
+import re
 
 BLOCK_SIZE = 4096
+PROBE_LIMIT = 100
+DEFAULT_PRUNE_GRACE_DAYS = 14
+ZERO_SHA = "0" * 40
+DEFAULT_JOBS = 8
+LAYOUT_MARKER = ".sharded"
+OBJECT_NAME = re.compile(r"[0-9a-f]{40}(%s)?" % re.escape(RECIPE_SUFFIX))
 
 
 class FatRepo:
@@ -27,10 +71,20 @@ class FatRepo:
         self.magiclen = self.get_magiclen()
         self.cookie = b"#$# git-fat"
         self.objdir = self.workspace / ".git" / "fat/objects"
+        self.packdir = self.workspace / ".git" / "fat/packs"
+        self.history_cache_path = self.workspace / ".git" / "fat/history"
+        self.stat_cache_path = self.workspace / ".git" / "fat" / STAT_CACHE
+        self.index_cache_path = self.workspace / ".git" / "fat/index"
+        self.remote_cache_path = self.workspace / ".git" / "fat/remote"
         self.debug = True if os.environ.get("GIT_FAT_VERBOSE") else False
+        self.jobs = int(os.environ.get("GIT_FAT_JOBS", DEFAULT_JOBS))
         self._gitfat_config = None
         self._fatstore = None
         self._smudgestore = None
+        self._pack_index: Optional[Dict[str, Tuple[str, int, int]]] = None
+        self._pack_sizes: Dict[str, int] = {}
+        self._local_objects: Optional[Set[str]] = None
+        self._odb_lock = threading.Lock()
         self.setup()
 
     @property
@@ -106,6 +160,31 @@ class FatRepo:
         config_keys = list(self.gitfat_config.keys())
         return config_keys[0]
 
+    def get_chunking_config(self) -> Optional[dict]:
+        """
+        Returns content defined chunking parameters when enabled in gitfat config, otherwise None
+        I.E. chunking = true, or a [s3.chunking] table with min_size, avg_size and max_size
+        """
+        if not self.gitfat_config_path.exists():
+            return None
+
+        fatstore_config = self.gitfat_config[self.get_fatstore_type()]
+        chunking = fatstore_config.get("chunking", False)
+        if not chunking:
+            return None
+
+        config = {"min_size": DEFAULT_MIN_SIZE, "avg_size": DEFAULT_AVG_SIZE, "max_size": DEFAULT_MAX_SIZE}
+        if isinstance(chunking, dict):
+            config.update({key: int(value) for key, value in chunking.items() if key in config})
+        return config
+
+    def get_pack_threshold(self) -> int:
+        """
+        Returns size in bytes under which fat objects are bundled into packs on push, 0 disables packing
+        """
+        fatstore_config = self.gitfat_config[self.get_fatstore_type()]
+        return int(fatstore_config.get("pack_threshold", 0))
+
     def get_smudgestore(self):
         """
         Returns initialize smudge store as described in gitfat config
@@ -137,22 +216,181 @@ class FatRepo:
 
     def create_fatobj(self, blob: git.objects.Blob) -> FatObj:
         fatid, size = self.decode_fatstub(blob.data_stream.read())
-        fatobj_path = Path(blob.abspath)
+        return FatObj(fatid=tostr(fatid), path=blob.path, size=size)
 
-        return FatObj(path=fatobj_path, fatid=tostr(fatid), size=size, working_dir=Path(self.workspace))
+    def get_abspath(self, obj: FatObj) -> str:
+        return str(self.workspace / obj.path)
 
-    def get_indexed_fatobjs(self) -> Set[FatObj]:
+    @traced("discover.index")
+    def get_indexed_fatobjs(
+        self, pathspecs: Optional[List[str]] = None, skip_sparse: bool = False, cwd: Optional[Path] = None
+    ) -> Set[FatObj]:
         """
-        Returns a filtered list of GitPython blob objects categorized as git-fat blobs.
-        see: https://gitpython.readthedocs.io/en/stable/reference.html?highlight=size#module-git.objects.base
+        Returns set of FatObjs in the git index, resolved with one `git ls-files` pass
+            Parameters:
+                pathspecs: git pathspecs limiting the entries, relative to cwd (default: working tree root)
+                skip_sparse: leave out entries outside the sparse-checkout definition (skip-worktree)
         """
-        unique_fatobjs = set()
+        ls_files = subprocess.run(
+            ["git", "ls-files", "--full-name", "-s", "-t", "-z", "--", *(pathspecs or [])],
+            cwd=str(cwd or self.workspace),
+            stdout=subprocess.PIPE,
+            check=True,
+        ).stdout.decode("utf-8", "surrogateescape")
 
-        index = self.gitapi.index
-        unique_fatobjs = {
-            self.create_fatobj(blob) for stage, blob in index.iter_blobs() if stage == 0 and self.is_fatblob(blob)
-        }
-        return unique_fatobjs
+        entries: Dict[str, List[str]] = {}
+        for entry in ls_files.split("\0"):
+            if not entry:
+                continue
+            info, path = entry.split("\t", 1)
+            tag, _, sha, stage = info.split()
+            if stage != "0" or (skip_sparse and tag == "S"):
+                continue
+            entries.setdefault(sha, []).append(path)
+
+        candidates = [sha for sha, objtype, size in batch_check(self.workspace, entries) if size == self.magiclen]
+        fatobjs = set()
+        for sha, data in read_blobs(self.workspace, candidates):
+            if not self.is_fatstub(data):
+                continue
+            fatid, size = self.decode_fatstub(tostr(data))
+            fatobjs.update(FatObj(fatid=fatid, path=path, size=size) for path in entries[sha])
+        return fatobjs
+
+    def get_index_signature(self) -> str:
+        st = os.stat(self.gitapi.index.path)
+        return f"{st.st_size} {st.st_mtime_ns} {st.st_ino}"
+
+    def get_cached_indexed_fatobjs(self) -> Set[FatObj]:
+        """
+        Returns all FatObjs in the git index, reusing the result of the last call while the index file is unchanged
+        """
+        signature = self.get_index_signature()
+        if self.index_cache_path.exists():
+            with open(self.index_cache_path) as cache_handle:
+                if cache_handle.readline().rstrip("\n") == signature:
+                    fatobjs = set()
+                    for line in cache_handle:
+                        fatid, size, path = line.rstrip("\n").split(" ", 2)
+                        fatobjs.add(FatObj(fatid=fatid, path=path, size=int(size)))
+                    return fatobjs
+
+        fatobjs = self.get_indexed_fatobjs()
+        fd, tmpfile_path = tempfile.mkstemp(dir=self.index_cache_path.parent)
+        with os.fdopen(fd, "w") as cache_handle:
+            cache_handle.write(signature + "\n")
+            cache_handle.writelines(f"{fatobj.fatid} {fatobj.size} {fatobj.path}\n" for fatobj in fatobjs)
+        os.replace(tmpfile_path, self.index_cache_path)
+        return fatobjs
+
+    @traced("discover.tree")
+    def get_tree_fatobjs(self, commit: Commit) -> Set[FatObj]:
+        """
+        Returns set of FatObjs found in the tree of given commit, only blobs of fat stub size are read
+        """
+        fatobjs = set()
+        ls_tree = self.gitapi.git.ls_tree("-r", "-l", "-z", commit.hexsha)
+        for entry in ls_tree.split("\0"):
+            if not entry:
+                continue
+            info, path = entry.split("\t", 1)
+            mode, objtype, hexsha, size = info.split()
+            if objtype != "blob" or size == "-" or int(size) != self.magiclen:
+                continue
+            blob = git.objects.Blob(self.gitapi, bytes.fromhex(hexsha), int(mode, 8), path)
+            if self.is_fatblob(blob):
+                fatobjs.add(self.create_fatobj(blob))
+        return fatobjs
+
+    def iter_fatstubs(self, rev_args: List[str]) -> Iterator[Tuple[str, str, int]]:
+        """
+        Yields (path, fatid, size) of every fat stub reachable from rev_args in a single rev-list pass
+        Only blobs of fat stub size are read, in bounded batches
+        """
+        candidates: Dict[str, str] = {}
+        for sha, _, size, path in iter_objects(self.workspace, rev_args, max_blob_size=self.magiclen):
+            if size != self.magiclen:
+                continue
+            candidates[sha] = path
+            if len(candidates) >= 10000:
+                yield from self.decode_fatstub_candidates(candidates)
+                candidates = {}
+        yield from self.decode_fatstub_candidates(candidates)
+
+    def decode_fatstub_candidates(self, candidates: Dict[str, str]) -> Iterator[Tuple[str, str, int]]:
+        for sha, data in read_blobs(self.workspace, candidates):
+            if not self.is_fatstub(data):
+                continue
+            fatid, size = self.decode_fatstub(tostr(data))
+            yield candidates[sha], fatid, size
+
+    @traced("discover.history")
+    def get_fatobjs_in_revs(self, rev_args: List[str]) -> Set[FatObj]:
+        """
+        Returns set of FatObjs reachable from rev_args, I.E. ["topic", "--not", "origin/master"]
+        """
+        return {FatObj(fatid=fatid, path=path, size=size) for path, fatid, size in self.iter_fatstubs(rev_args)}
+
+    def read_history_cache(self) -> Tuple[Set[str], Set[FatObj]]:
+        """
+        Returns ref tips already walked and the FatObjs found reachable from them
+        """
+        tips: Set[str] = set()
+        fatobjs: Set[FatObj] = set()
+        if not self.history_cache_path.exists():
+            return tips, fatobjs
+
+        with open(self.history_cache_path) as cache_handle:
+            for line in cache_handle:
+                kind, value = line.rstrip("\n").split(" ", 1)
+                if kind == "tip":
+                    tips.add(value)
+                    continue
+                size, path = value.split(" ", 1)
+                fatobjs.add(FatObj(fatid=kind, path=path, size=int(size)))
+        return tips, fatobjs
+
+    def write_history_cache(self, tips: Set[str], fatobjs: Set[FatObj]):
+        fd, tmpfile_path = tempfile.mkstemp(dir=self.history_cache_path.parent)
+        with os.fdopen(fd, "w") as cache_handle:
+            cache_handle.writelines(f"tip {tip}\n" for tip in sorted(tips))
+            cache_handle.writelines(f"{fatobj.fatid} {fatobj.size} {fatobj.path}\n" for fatobj in fatobjs)
+        os.replace(tmpfile_path, self.history_cache_path)
+
+    def get_history_fatobjs(self, rev_args: Optional[List[str]] = None) -> Set[FatObj]:
+        """
+        Returns FatObjs referenced anywhere in history of rev_args, or of all refs when not given
+        For all refs the result is cached, later calls only walk commits not reachable from tips walked before
+        """
+        if rev_args is not None:
+            return self.get_fatobjs_in_revs(rev_args)
+
+        tips = set(self.gitapi.git.rev_parse("--all").split())
+        cached_tips, fatobjs = self.read_history_cache()
+        new_tips = tips - cached_tips
+        if new_tips:
+            known_tips = existing_objects(self.workspace, cached_tips)
+            rev_args = sorted(new_tips) + ["--not"] + sorted(known_tips)
+            fatobjs |= self.get_fatobjs_in_revs(rev_args)
+            self.write_history_cache(tips, fatobjs)
+        return fatobjs
+
+    def find_large_paths(self, threshold: int, rev_args: Optional[List[str]] = None) -> List[Tuple[str, int, int]]:
+        """
+        Returns (path, max size, count) of paths that held blobs larger than threshold in history of rev_args
+        (default: all REFs), largest first. Objects stream from one rev-list into one cat-file and only paths of
+        large blobs are kept, count is the number of distinct large blobs first seen at the path.
+        """
+        sizes: Dict[str, Tuple[int, int]] = {}
+        for _, _, size, path in iter_objects(self.workspace, rev_args or ["--all"]):
+            if size <= threshold or not path:
+                continue
+            max_size, count = sizes.get(path, (0, 0))
+            sizes[path] = (max(max_size, size), count + 1)
+        return sorted(
+            ((path, max_size, count) for path, (max_size, count) in sizes.items()),
+            key=lambda item: (-item[1], item[0]),
+        )
 
     def is_gitfat_initialized(self) -> bool:
         with self.gitapi.config_reader() as cr:
@@ -161,10 +399,15 @@ class FatRepo:
     def setup(self):
         if not self.objdir.exists():
             self.objdir.mkdir(mode=0o755, parents=True)
+            (self.objdir / LAYOUT_MARKER).touch()
+        elif not (self.objdir / LAYOUT_MARKER).exists():
+            self.migrate_objects()
+        if not self.packdir.exists():
+            self.packdir.mkdir(mode=0o755, parents=True)
 
         if not self.is_gitfat_initialized():
             with self.gitapi.config_writer() as cw:
-                cw.set_value('filter "fat"', "clean", "git fat filter-clean")
+                cw.set_value('filter "fat"', "clean", "git fat filter-clean %f")
                 cw.set_value('filter "fat"', "smudge", "git fat filter-smudge")
 
     def is_fatstub(self, data: bytes) -> bool:
@@ -173,118 +416,663 @@ class FatRepo:
             return False
         return cookie == self.cookie
 
+    def shard_path(self, name: str) -> Path:
+        """
+        Returns where cache file name is stored, I.E. .git/fat/objects/ab/abcdef...
+        """
+        return self.objdir / name[:2] / name
+
+    def object_path(self, name: str) -> Path:
+        """
+        Returns the path of cache file name, falling back to the flat layout for files written by older versions
+        """
+        path = self.shard_path(name)
+        if path.exists():
+            return path
+        legacy_path = self.objdir / name
+        return legacy_path if legacy_path.exists() else path
+
+    def has_object(self, name: str) -> bool:
+        return self.shard_path(name).exists() or (self.objdir / name).exists()
+
+    def new_object_path(self, name: str) -> Path:
+        path = self.shard_path(name)
+        path.parent.mkdir(mode=0o755, exist_ok=True)
+        if self._local_objects is not None:
+            self._local_objects.add(name)
+        return path
+
+    def get_local_objects(self) -> Set[str]:
+        """
+        Returns names of all cache files. The cache is scanned once, on first use, and the result kept up to date
+        as files are cached; single lookups should use has_object instead.
+        """
+        if self._local_objects is None:
+            names = set()
+            with os.scandir(self.objdir) as entries:
+                for entry in entries:
+                    if len(entry.name) == 2 and entry.is_dir():
+                        names.update(os.listdir(entry.path))
+                    elif OBJECT_NAME.fullmatch(entry.name):
+                        names.add(entry.name)
+            self._local_objects = names
+        return self._local_objects
+
+    def migrate_objects(self) -> None:
+        """
+        Moves cache files of the flat objects/<sha> layout into objects/ab/<sha> shards. An interrupted migration
+        resumes on next run, files not moved yet are still found through object_path.
+        """
+        moved = 0
+        with os.scandir(self.objdir) as entries:
+            for entry in entries:
+                if not OBJECT_NAME.fullmatch(entry.name) or not entry.is_file():
+                    continue
+                try:
+                    os.replace(entry.path, self.new_object_path(entry.name))
+                    moved += 1
+                except FileNotFoundError:
+                    # moved by a concurrent git-fat process
+                    pass
+        (self.objdir / LAYOUT_MARKER).touch()
+        self.verbose(f"git-fat: moved {moved} cached objects into sharded layout", force=moved > 0)
+
+    def download_object(self, name: str) -> None:
+        self.fatstore.download(name, self.new_object_path(name))
+
     def cache_fatfile(self, cached_file: str, file_sha_digest: str):
-        objfile = self.objdir / file_sha_digest
-        if objfile.exists():
-            self.verbose(f"git-fat: cache already exists {objfile}")
+        if self.has_object(file_sha_digest):
+            self.verbose(f"git-fat: cache already exists {self.object_path(file_sha_digest)}")
             os.remove(cached_file)
             return
 
+        objfile = self.new_object_path(file_sha_digest)
         # Set permissions for the new file using the current umask
         os.chmod(cached_file, int("444", 8) & ~umask())
         os.rename(cached_file, objfile)
         self.verbose(f"git-fat filter-clean: caching to {objfile.relative_to(self.workspace)}")
 
-    def filter_clean(self, input_handle: IO, output_handle: IO):
+    def recipe_path(self, fatid: str) -> Path:
+        return self.object_path(fatid + RECIPE_SUFFIX)
+
+    def read_recipe(self, fatid: str) -> List[Tuple[str, int]]:
         """
-        Takes IO byte stream (input_handle), writes git-fat file stub (sha-magic) bytes on output_handle
+        Returns ordered list of (chunkid, size) needed to reassemble fatid from the local cache
+        """
+        _, _, chunks = decode_recipe(self.recipe_path(fatid).read_bytes())
+        return chunks
+
+    def is_fatobj_cached(self, fatid: str) -> bool:
+        """
+        Returns true if fatid can be restored from the local cache, either whole or from its chunks
+        """
+        if self.has_object(fatid):
+            return True
+        if not self.has_object(fatid + RECIPE_SUFFIX):
+            return False
+        return all(self.has_object(chunkid) for chunkid, _ in self.read_recipe(fatid))
+
+    def iter_fatobj_blocks(self, fatid: str) -> Iterator[bytes]:
+        """
+        Yields the contents of a cached fat object, reassembling chunked objects on the fly
+        """
+        fatfile = self.object_path(fatid)
+        parts = (
+            [fatfile] if fatfile.exists() else [self.object_path(chunkid) for chunkid, _ in self.read_recipe(fatid)]
+        )
+        for part in parts:
+            with open(part, "rb") as part_handle:
+                while True:
+                    block = part_handle.read(BLOCK_SIZE)
+                    if not block:
+                        break
+                    yield block
+
+    def assemble_fatobj(self, fatid: str, destination: Union[str, Path]):
         """
-        first_block = tobytes(input_handle.read(BLOCK_SIZE))
-        if self.is_fatstub(first_block):
-            output_handle.write(first_block)
+        Writes the contents of a cached fat object to destination
+        """
+        fatfile = self.object_path(fatid)
+        if fatfile.exists():
+            clone_file(fatfile, destination)
             return
 
+        with open(destination, "wb") as destination_handle:
+            for block in self.iter_fatobj_blocks(fatid):
+                destination_handle.write(block)
+
+    def cache_chunk(self, chunk: bytes) -> str:
+        """
+        Stores chunk in the local cache by its sha1 digest, returns the digest
+        """
+        chunkid = hashlib.sha1(chunk).hexdigest()
+        if self.has_object(chunkid):
+            return chunkid
+
         fd, tmpfile_path = tempfile.mkstemp(dir=self.objdir)
-        sha = hashlib.new("sha1")
-        sha.update(first_block)
-        fat_size = len(first_block)
+        with os.fdopen(fd, "wb") as tmpfile_handle:
+            tmpfile_handle.write(chunk)
+        self.cache_fatfile(tmpfile_path, chunkid)
+        return chunkid
+
+    def cache_recipe(self, fatid: str, size: int, chunks: List[Tuple[str, int]]):
+        if self.has_object(fatid + RECIPE_SUFFIX):
+            return
 
+        fd, tmpfile_path = tempfile.mkstemp(dir=self.objdir)
         with os.fdopen(fd, "wb") as tmpfile_handle:
-            tmpfile_handle.write(first_block)
+            tmpfile_handle.write(encode_recipe(fatid, size, chunks))
+        self.cache_fatfile(tmpfile_path, fatid + RECIPE_SUFFIX)
+        self.verbose(f"git-fat filter-clean: caching {len(chunks)} chunks for {fatid}")
+
+    def clean_chunked(self, first_block: bytes, input_handle: IO, chunking: dict) -> Tuple[str, int]:
+        """
+        Splits input stream into content defined chunks, caches each chunk and a recipe keyed by the fatid
+        Returns fatid and size of the whole stream
+        """
+
+        def read_blocks():
+            yield first_block
             while True:
-                block = tobytes(input_handle.read(BLOCK_SIZE))
+                block = tobytes(input_handle.read(BUFFER_SIZE))
                 if not block:
                     break
-                sha.update(block)
-                fat_size += len(block)
-                tmpfile_handle.write(block)
-            tmpfile_handle.flush()
+                yield block
+
+        sha = hashlib.new("sha1")
+        fat_size = 0
+        chunks = []
+        for chunk in iter_chunks(read_blocks(), **chunking):
+            sha.update(chunk)
+            fat_size += len(chunk)
+            chunks.append((self.cache_chunk(chunk), len(chunk)))
+
+        sha_digest = sha.hexdigest()
+        if len(chunks) == 0:
+            # empty stream, cache as a regular (empty) fat object
+            self.cache_chunk(b"")
+        elif len(chunks) > 1:
+            # single chunk streams are already cached as a regular fat object (chunkid == fatid)
+            self.cache_recipe(sha_digest, fat_size, chunks)
+        return sha_digest, fat_size
+
+    def clean_stream(self, first_block: bytes, input_handle: IO) -> Tuple[str, int]:
+        """
+        Caches input stream as a single fat object, returns fatid and size of the stream
+        """
+        fd, tmpfile_path = tempfile.mkstemp(dir=self.objdir)
+        with os.fdopen(fd, "wb") as tmpfile_handle:
+            sha, fat_size = hash_copy_stream(input_handle, tmpfile_handle, first_block)
 
         sha_digest = sha.hexdigest()
         self.cache_fatfile(tmpfile_path, sha_digest)
-        fatstub = self.encode_fatstub(sha_digest, fat_size)
-        # output clean bytes (fatstub) to output_handle
-        output_handle.write(tobytes(fatstub))
+        return sha_digest, fat_size
 
-    def filter_smudge(self, input_handle: IO, output_handle: IO):
+    def filter_clean(self, input_handle: IO, output_handle: IO, path: Optional[str] = None) -> Optional[str]:
+        """
+        Takes IO byte stream (input_handle), writes git-fat file stub (sha-magic) bytes on output_handle
+        Returns the fatid of the cleaned file, None if the input already was a stub
+            Parameters:
+                path: worktree path of the stream (git passes it as %f), files whose stat info matches the
+                      stat cache are neither read nor hashed again, others are read from disk directly
+        """
+        with span("filter.clean", count=1) as clean:
+            before = None
+            if path:
+                cached = self.lookup_stat_cache(path)
+                if cached:
+                    clean.name = "filter.clean.cached"
+                    output_handle.write(tobytes(self.encode_fatstub(*cached)))
+                    return cached[0]
+                before = self.stat_worktree_file(path)
+
+            first_block = tobytes(input_handle.read(BLOCK_SIZE))
+            if self.is_fatstub(first_block):
+                output_handle.write(first_block)
+                return None
+
+            chunking = self.get_chunking_config()
+            if path and before and self.is_stream_of_file(path, first_block):
+                # the rest of the stream is left unread, git ignores EPIPE from clean filters
+                sha_digest, fat_size = self.clean_file(self.workspace / path)
+            elif chunking:
+                sha_digest, fat_size = self.clean_chunked(first_block, input_handle, chunking)
+            else:
+                sha_digest, fat_size = self.clean_stream(first_block, input_handle)
+
+            if path and before:
+                entry = self.checked_stat_entry(path, sha_digest, fat_size, before)
+                if entry:
+                    self.append_stat_cache({path: entry})
+            # output clean bytes (fatstub) to output_handle
+            output_handle.write(tobytes(self.encode_fatstub(sha_digest, fat_size)))
+            clean.bytes = fat_size
+            return sha_digest
+
+    def stat_worktree_file(self, path: str) -> Optional[os.stat_result]:
+        try:
+            return os.stat(self.workspace / path)
+        except OSError:
+            return None
+
+    def read_stat_cache(self) -> Dict[str, StatEntry]:
+        if not self.stat_cache_path.exists():
+            return {}
+        return decode_stat_cache(self.stat_cache_path.read_bytes())
+
+    def append_stat_cache(self, entries: Dict[str, StatEntry]) -> None:
+        """
+        Appends entries to the stat cache, single appends are cheap for filter-clean and later records win
+        """
+        with open(self.stat_cache_path, "ab") as stat_cache_handle:
+            stat_cache_handle.write(b"".join(encode_stat_entry(path, entry) for path, entry in entries.items()))
+
+    def write_stat_cache(self, entries: Dict[str, StatEntry]) -> None:
+        """
+        Rewrites the stat cache without superseded records, dropping entries of files no longer in the worktree
+        """
+        records = [
+            encode_stat_entry(path, entry) for path, entry in entries.items() if (self.workspace / path).exists()
+        ]
+        fd, tmpfile_path = tempfile.mkstemp(dir=self.stat_cache_path.parent)
+        with os.fdopen(fd, "wb") as tmpfile_handle:
+            tmpfile_handle.write(b"".join(records))
+        os.replace(tmpfile_path, self.stat_cache_path)
+
+    def lookup_stat_cache(
+        self, path: str, entries: Optional[Dict[str, StatEntry]] = None
+    ) -> Optional[Tuple[str, int]]:
+        """
+        Returns fatid and size of a worktree file if its stat info is unchanged since it was hashed and its fat
+        object is still cached, otherwise None
+        """
+        entries = self.read_stat_cache() if entries is None else entries
+        entry = entries.get(path)
+        if entry is None:
+            return None
+        st = self.stat_worktree_file(path)
+        if st is None or not is_stat_match(entry, st) or not self.is_fatobj_cached(entry[0]):
+            return None
+        return entry[0], entry[1]
+
+    def checked_stat_entry(self, path: str, fatid: str, size: int, before: os.stat_result) -> Optional[StatEntry]:
+        """
+        Returns the stat entry to remember for a hashed file, None if it changed while being hashed or was
+        modified too recently to be trusted
+        """
+        after = self.stat_worktree_file(path)
+        if after is None or size != after.st_size or not is_stat_match(stat_entry(fatid, before), after):
+            return None
+        if is_racy(after):
+            return None
+        return stat_entry(fatid, after)
+
+    def clean_file(self, abspath: Union[str, Path]) -> Tuple[str, int]:
+        """
+        Caches a file on disk, returns its fatid and size. The file is copied into the cache with copy_file_range
+        (reflinked where the filesystem supports it) while the copy is hashed, falling back to buffered reads.
+        """
+        with open(abspath, "rb", buffering=0) as input_handle:
+            chunking = self.get_chunking_config()
+            if chunking:
+                return self.clean_chunked(b"", input_handle, chunking)
+
+            fd, tmpfile_path = tempfile.mkstemp(dir=self.objdir)
+            with os.fdopen(fd, "w+b") as tmpfile_handle:
+                copied = hash_copy_file(input_handle.fileno(), tmpfile_handle.fileno())
+                if copied is None:
+                    copied = hash_copy_stream(input_handle, tmpfile_handle)
+            sha, fat_size = copied
+
+        sha_digest = sha.hexdigest()
+        self.cache_fatfile(tmpfile_path, sha_digest)
+        return sha_digest, fat_size
+
+    def is_stream_of_file(self, path: str, first_block: bytes) -> bool:
+        """
+        Returns true if the worktree file at path is a regular file starting with first_block, I.E. it is what
+        git is streaming to filter-clean and can be read directly instead
+        """
+        try:
+            with open(self.workspace / path, "rb") as file_handle:
+                if not stat.S_ISREG(os.fstat(file_handle.fileno()).st_mode):
+                    return False
+                return file_handle.read(len(first_block)) == first_block
+        except OSError:
+            return False
+
+    def ingest_file(self, path: str) -> Tuple[str, str, int, Optional[StatEntry]]:
+        """
+        Cleans a worktree file for `git fat add`, returns path, fatid, size and the stat entry to remember
+        """
+        before = os.stat(self.workspace / path)
+        fatid, size = self.clean_file(self.workspace / path)
+        return path, fatid, size, self.checked_stat_entry(path, fatid, size, before)
+
+    def list_addable_files(self, pathspecs: List[str], cwd: Optional[Path] = None) -> List[str]:
+        """
+        Returns repository relative paths `git add` would consider for pathspecs: tracked files (including
+        deleted ones) and untracked files that aren't ignored
+        """
+        output = subprocess.run(
+            ["git", "ls-files", "-z", "--full-name", "--cached", "--others", "--exclude-standard", "--"] + pathspecs,
+            cwd=str(cwd or self.workspace),
+            stdout=subprocess.PIPE,
+            check=True,
+        ).stdout
+        paths = output.decode("utf-8", "surrogateescape").split("\0")
+        return list(dict.fromkeys(path for path in paths if path))
+
+    def get_fat_filtered(self, paths: List[str]) -> Set[str]:
+        """
+        Returns the subset of paths using the fat filter, checked with one `git check-attr`
+        """
+        if len(paths) == 0:
+            return set()
+        output = subprocess.run(
+            ["git", "check-attr", "-z", "--stdin", "filter"],
+            cwd=str(self.workspace),
+            input="\0".join(paths).encode("utf-8", "surrogateescape") + b"\0",
+            stdout=subprocess.PIPE,
+            check=True,
+        ).stdout
+        fields = output.decode("utf-8", "surrogateescape").split("\0")
+        return {fields[i] for i in range(0, len(fields) - 2, 3) if fields[i + 2] == "fat"}
+
+    def write_stub_blob(self, fatid: str, size: int) -> str:
+        """
+        Stores the fatstub of fatid in the git object database, returns the blob sha
+        """
+        stub = tobytes(self.encode_fatstub(fatid, size))
+        istream = self.gitapi.odb.store(IStream("blob", len(stub), io.BytesIO(stub)))
+        return tostr(istream.hexsha)
+
+    def add(self, pathspecs: List[str], cwd: Optional[Path] = None, jobs: Optional[int] = None) -> None:
+        """
+        Stages files like `git add`. Files using the fat filter are hashed and cached across a process pool and
+        their stubs written to the index with one `git update-index`, files unchanged since they were last
+        hashed (stat cache) are skipped. Other files and deletions are handed to `git add`.
+        """
+        paths = self.list_addable_files(pathspecs, cwd)
+        existing = [
+            path for path in paths if (self.workspace / path).is_file() and not (self.workspace / path).is_symlink()
+        ]
+        fat_paths = self.get_fat_filtered(existing)
+        other_paths = [path for path in paths if path not in fat_paths]
+
+        stat_cache = self.read_stat_cache()
+        cleaned: Dict[str, Tuple[str, int]] = {}
+        to_hash = []
+        for path in sorted(fat_paths):
+            cached = self.lookup_stat_cache(path, stat_cache)
+            if cached:
+                cleaned[path] = cached
+            else:
+                to_hash.append(path)
+        self.verbose(f"git-fat add: {len(to_hash)} files to hash, {len(cleaned)} unchanged", force=True)
+
+        # largest files first so a big file picked up last doesn't leave the other workers idle
+        to_hash.sort(key=lambda path: (self.workspace / path).stat().st_size, reverse=True)
+        jobs = jobs or os.cpu_count() or 1
+        if jobs == 1 or len(to_hash) <= 1:
+            self._add_cleaned(map(self.ingest_file, to_hash), cleaned, stat_cache)
+        else:
+            with ProcessPoolExecutor(
+                max_workers=jobs, initializer=_init_ingest_worker, initargs=(self.workspace,)
+            ) as executor:
+                self._add_cleaned(executor.map(_ingest_file, to_hash), cleaned, stat_cache)
+
+        index_info = []
+        for path, (fatid, size) in sorted(cleaned.items()):
+            mode = "100755" if (self.workspace / path).stat().st_mode & 0o100 else "100644"
+            index_info.append(f"{mode} {self.write_stub_blob(fatid, size)}\t{path}")
+        if index_info:
+            subprocess.run(
+                ["git", "update-index", "-z", "--index-info"],
+                cwd=str(self.workspace),
+                input="\0".join(index_info).encode("utf-8", "surrogateescape") + b"\0",
+                check=True,
+            )
+        if other_paths:
+            subprocess.run(
+                ["git", "add", "--all", "--pathspec-from-file=-", "--pathspec-file-nul"],
+                cwd=str(self.workspace),
+                input="\0".join(f":(top,literal){path}" for path in other_paths).encode("utf-8", "surrogateescape")
+                + b"\0",
+                check=True,
+            )
+        self.write_stat_cache(stat_cache)
+
+    def _add_cleaned(
+        self,
+        results: Iterator[Tuple[str, str, int, Optional[StatEntry]]],
+        cleaned: Dict[str, Tuple[str, int]],
+        stat_cache: Dict[str, StatEntry],
+    ) -> None:
+        for path, fatid, size, entry in results:
+            self.verbose(f"git-fat add: {path} -> {fatid}")
+            cleaned[path] = (fatid, size)
+            if entry:
+                stat_cache[path] = entry
+
+    def filter_smudge(self, input_handle: IO, output_handle: IO) -> Optional[str]:
         """
         Takes IO byte stream (git-fat file stub), writes full file contents on output_handle
+        Returns the fatid of the stub, None if the input isn't one
         """
-        fatstub_candidate = input_handle.read(self.magiclen)
-        if not self.is_fatstub(fatstub_candidate):
-            self.verbose("Not a git-fat object")
-            self.verbose("git-fat filter-smudge: fat stub not found in input stream")
-            return
+        with span("filter.smudge", count=1) as smudge:
+            fatstub_candidate = input_handle.read(self.magiclen)
+            if not self.is_fatstub(fatstub_candidate):
+                self.verbose("Not a git-fat object")
+                self.verbose("git-fat filter-smudge: fat stub not found in input stream")
+                return None
 
-        sha_digest, size = self.decode_fatstub(fatstub_candidate)
-        fatfile = self.objdir / tostr(sha_digest)
-        if not fatfile.exists():
-            self.verbose("git-fat filter-smudge: fat object missing, run: git-fat pull-new")
-            output_handle.write(fatstub_candidate)
-            return
+            sha_digest, size = self.decode_fatstub(fatstub_candidate)
+            fatid = tostr(sha_digest)
+            fatfile = self.object_path(fatid)
+            if not self.is_fatobj_cached(fatid):
+                self.verbose("git-fat filter-smudge: fat object missing, run: git-fat pull-new")
+                output_handle.write(fatstub_candidate)
+                return fatid
 
-        read_size = 0
-        with open(fatfile, "rb") as fatfile_handle:
-            while True:
-                block = fatfile_handle.read(BLOCK_SIZE)
-                if not block:
-                    break
+            read_size = 0
+            for block in self.iter_fatobj_blocks(fatid):
                 output_handle.write(block)
                 read_size += len(block)
+            smudge.bytes = read_size
+
+            relative_obj = fatfile.relative_to(self.workspace)
+            if read_size != size:
+                self.verbose(
+                    f"git-fat filter-smudge: invalid file size of {relative_obj}, expected: {size}, got: {read_size}",
+                    force=True,
+                )
+            return fatid
+
+    def restore_fatobj(self, fatid: str, paths: List[str]) -> None:
+        """
+        Restores a cached fat object to every path sharing it, the first path is written from the cache and
+        the others are cloned from it (reflinks where the filesystem supports them). Worktree file modes are kept.
+        """
+        source = None
+        with span("restore", count=len(paths)) as restore:
+            for path in paths:
+                abspath = self.workspace / path
+                self.verbose(f"git-fat pull: restore {path} from {fatid}", force=True)
+                mode = abspath.stat().st_mode if abspath.exists() else None
+                abspath.unlink(missing_ok=True)
+                abspath.parent.mkdir(parents=True, exist_ok=True)
+                if source is None:
+                    self.assemble_fatobj(fatid, abspath)
+                    source = abspath
+                else:
+                    clone_file(source, abspath)
+                if mode is not None:
+                    os.chmod(abspath, mode)
+                restore.bytes += abspath.stat().st_size
 
-        relative_obj = fatfile.relative_to(self.workspace)
-        if read_size != size:
-            self.verbose(
-                f"git-fat filter-smudge: invalid file size of {relative_obj}, expected: {size}, got: {read_size}",
-                force=True,
+    def update_index(self, paths: List[str]) -> None:
+        """
+        Refreshes index entries of restored paths with one `git update-index` call
+        """
+        if len(paths) == 0:
+            return
+        with span("update-index", count=len(paths)):
+            subprocess.run(
+                ["git", "update-index", "-z", "--stdin"],
+                cwd=str(self.workspace),
+                input="\0".join(paths).encode() + b"\0",
+                check=True,
             )
 
-    def restore_fatobj(self, obj: FatObj):
-        cache = self.objdir / obj.fatid
-        self.verbose(f"git-fat pull: restore {obj.path} from {cache.name}", force=True)
-        shutil.copy2(self.objdir / obj.fatid, obj.abspath)
-        self.gitapi.git.execute(
-            command=["git", "update-index", obj.abspath],
-            stdout_as_string=True,
-        )
+    def get_pack_index(self, remote_fatfiles: Set[str]) -> Dict[str, Tuple[str, int, int]]:
+        """
+        Returns map of fatid -> (pack name, offset, size) for every pack on remote
+        Pack indexes are immutable, so each one is only downloaded once and kept in the local packs directory
+        """
+        if self._pack_index is not None:
+            return self._pack_index
+
+        self._pack_index = {}
+        for index_name in sorted(name for name in remote_fatfiles if is_pack_index(name)):
+            local_index = self.packdir / index_name
+            if not local_index.exists():
+                self.verbose(f"git-fat: downloading pack index {index_name}")
+                self.fatstore.download(index_name, local_index)
+            pack_size = 0
+            for fatid, offset, size in decode_pack_index(local_index.read_bytes()):
+                self._pack_index[fatid] = (pack_name(index_name), offset, size)
+                pack_size = max(pack_size, offset + size)
+            self._pack_sizes[pack_name(index_name)] = pack_size
+        return self._pack_index
+
+    def is_on_remote(self, fatid: str, remote_fatfiles: Set[str]) -> bool:
+        """
+        Returns true if fatid is available from a fatstore listing, whole, as a chunk recipe or inside a pack
+        """
+        if fatid in remote_fatfiles or (fatid + RECIPE_SUFFIX) in remote_fatfiles:
+            return True
+        return fatid in self.get_pack_index(remote_fatfiles)
+
+    def cache_packed_fatobj(self, fatid: str, data: bytes):
+        if hashlib.sha1(data).hexdigest() != fatid:
+            self.verbose(f"git-fat pull: corrupt packed object {fatid}, skipping", force=True)
+            return
+        fd, tmpfile_path = tempfile.mkstemp(dir=self.objdir)
+        with os.fdopen(fd, "wb") as tmpfile_handle:
+            tmpfile_handle.write(data)
+        self.cache_fatfile(tmpfile_path, fatid)
+
+    def download_packed_fatobjs(self, fatids: Set[str], remote_fatfiles: Set[str]) -> None:
+        """
+        Downloads fatids found in remote packs, neighbouring objects are fetched with one ranged GET and
+        packs that are mostly needed are downloaded whole
+        """
+        pack_index = self.get_pack_index(remote_fatfiles)
+        wanted: Dict[str, List[PackEntry]] = {}
+        for fatid in fatids:
+            if fatid in pack_index:
+                name, offset, size = pack_index[fatid]
+                wanted.setdefault(name, []).append((fatid, offset, size))
+
+        for name, entries in wanted.items():
+            pack_size = self._pack_sizes[name]
+            ranges = coalesce_ranges(entries)
+            if sum(end - start for start, end, _ in ranges) * 2 >= pack_size:
+                ranges = [(0, pack_size, entries)]
+            self.verbose(f"git-fat pull: fetching {len(entries)} objects from {name} in {len(ranges)} requests")
+            for start, end, members in ranges:
+                data = self.fatstore.download_range(name, start, end)
+                for fatid, offset, size in members:
+                    self.cache_packed_fatobj(fatid, data[offset - start : offset - start + size])
+
+    def download_fatobj(self, fatid: str, remote_fatfiles: Set[str]) -> None:
+        """
+        Downloads fatid into the local cache, for chunked objects only chunks missing locally are fetched
+        """
+        if fatid in remote_fatfiles:
+            self.verbose(f"git-fat pull: downloading {fatid}")
+            self.download_object(fatid)
+            return
+
+        recipe_name = fatid + RECIPE_SUFFIX
+        if not self.has_object(recipe_name):
+            self.verbose(f"git-fat pull: downloading {recipe_name}")
+            self.download_object(recipe_name)
+
+        missing_chunks = [chunkid for chunkid, _ in self.read_recipe(fatid) if not self.has_object(chunkid)]
+        self.verbose(f"git-fat pull: downloading {len(missing_chunks)} missing chunks of {fatid}")
+        for chunkid in dict.fromkeys(missing_chunks):
+            self.download_object(chunkid)
+
+    def is_worktree_stub(self, obj: FatObj) -> bool:
+        """
+        Returns true if the working tree copy of obj is still a fat stub, I.E. cached but never restored
+        """
+        try:
+            abspath = self.get_abspath(obj)
+            if os.path.getsize(abspath) != self.magiclen:
+                return False
+            with open(abspath, "rb") as worktree_handle:
+                return self.is_fatstub(worktree_handle.read(self.magiclen))
+        except OSError:
+            return False
 
     def pull_fatojbs(self, fatobjs: Set[FatObj]) -> None:
         """
         Takes a set of FatOjbs downloads and retores the fat files
         """
-        local_fatfiles = os.listdir(self.objdir)
-        remote_fatfiles = self.fatstore.list()
-        pull_candidates = [file for file in remote_fatfiles if file not in local_fatfiles]
+        remote_fatfiles = set(self.fatstore.list())
+        pull_candidates: Dict[str, List[str]] = {}
+        for obj in fatobjs:
+            if not self.is_fatobj_cached(obj.fatid) or self.is_worktree_stub(obj):
+                pull_candidates.setdefault(obj.fatid, []).append(obj.path)
         if len(pull_candidates) == 0:
             self.verbose("git-fat pull: nothing to pull", force=True)
             return
 
-        for obj in fatobjs:
-            if obj.fatid not in pull_candidates or obj.fatid not in remote_fatfiles:
-                self.verbose(f"git-fat pull: {obj.path} found locally, skipping")
+        # each fat object is downloaded once, no matter how many paths share it
+        self.download_fatobjs(set(pull_candidates), remote_fatfiles)
+        restored = []
+        for fatid, paths in pull_candidates.items():
+            if not self.is_fatobj_cached(fatid):
+                self.verbose(f"git-fat pull: {', '.join(paths)} not found on remote store, skipping")
                 continue
-            self.verbose(f"git-fat pull: downloading {obj.fatid}")
-            self.fatstore.download(obj.fatid, self.objdir / obj.fatid)
-            self.restore_fatobj(obj)
+            self.restore_fatobj(fatid, sorted(paths))
+            restored.extend(paths)
+        self.update_index(restored)
+
+    def download_fatobjs(self, fatids: Set[str], remote_fatfiles: Set[str]) -> None:
+        """
+        Downloads fatids missing from the local cache, packed objects first, then one key per fatid
+        """
+        missing = {fatid for fatid in fatids if not self.is_fatobj_cached(fatid)}
+        self.download_packed_fatobjs(missing, remote_fatfiles)
+        downloads = [
+            fatid
+            for fatid in missing
+            if not self.is_fatobj_cached(fatid) and self.is_on_remote(fatid, remote_fatfiles)
+        ]
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            list(executor.map(lambda fatid: self.download_fatobj(fatid, remote_fatfiles), downloads))
 
     def pull_all(self) -> None:
         """
         Pulls all FatOjbs found in the git index
         """
         self.verbose("git-fat: pulling all FatOjbs")
-        idx_fatobjs = self.get_indexed_fatobjs()
+        idx_fatobjs = self.get_indexed_fatobjs(skip_sparse=True)
         self.pull_fatojbs(idx_fatobjs)
 
+    def pull_history(self, rev_args: Optional[List[str]] = None) -> None:
+        """
+        Downloads every FatObj referenced in history (default: all refs) and restores those in the git index
+        """
+        self.verbose("git-fat: pulling FatObjs referenced in history")
+        history_fatids = {fatobj.fatid for fatobj in self.get_history_fatobjs(rev_args)}
+        self.download_fatobjs(history_fatids, set(self.fatstore.list()))
+        self.pull_all()
+
     def pull_new(self, commit: Commit) -> None:
         """
         Takes a commit, compares commit and HEAD, and pulls new FatObjs in HEAD
@@ -294,19 +1082,30 @@ class FatRepo:
         fatobjs = self.get_added_fatobjs(commit, head)
         self.pull_fatojbs(fatobjs)
 
+    def pull_new_refs(self, refs: List[str]) -> None:
+        """
+        Takes REFs or rev ranges, pulls the union of FatObjs new in HEAD (or range target) in one pass
+        """
+        added_fatobjs = self.get_added_fatobjs_by_ref(refs, "HEAD")
+        for ref, fatobjs in added_fatobjs.items():
+            self.verbose(f"git-fat pull-new: {ref}: {len(fatobjs)} new fat objects", force=True)
+        self.pull_fatojbs(set().union(*added_fatobjs.values()))
+
     def convert_file_list_to_fatobjs(self, files: List[Path] = []) -> Set[FatObj]:
-        fatobjs = set()
+        rpaths = []
         for fpath in files:
             try:
-                rpath = fpath.relative_to(self.gitapi.working_dir)  # type: ignore
-                blob = self.gitapi.tree() / str(rpath)
-                if not self.is_fatblob(blob):
-                    self.verbose(f"git-fat pull: {rpath} is not a fat object", force=True)
-                    continue
-                obj = self.create_fatobj(blob)  # type: ignore
-                fatobjs.add(obj)
-            except KeyError:
+                rpaths.append(str(fpath.absolute().relative_to(self.workspace)))
+            except ValueError:
                 self.verbose(f"git-fat pull: {fpath} not part of git index")
+        if len(rpaths) == 0:
+            return set()
+
+        fatobjs = self.get_indexed_fatobjs(pathspecs=[f":(top,literal){rpath}" for rpath in rpaths])
+        found = {fatobj.path for fatobj in fatobjs}
+        for rpath in rpaths:
+            if rpath not in found:
+                self.verbose(f"git-fat pull: {rpath} is not a fat object", force=True)
         return fatobjs
 
     def pull(self, files: List[Path] = []):
@@ -316,31 +1115,208 @@ class FatRepo:
         fatobjs = self.convert_file_list_to_fatobjs(files)
         self.pull_fatojbs(fatobjs)
 
-    def push_fatobjs(self, objects: List[FatObj]):
+    def pull_pathspecs(
+        self,
+        pathspecs: List[str],
+        includes: List[str] = [],
+        excludes: List[str] = [],
+        cwd: Optional[Path] = None,
+    ) -> None:
+        """
+        Pulls FatObjs in the git index matching pathspecs and include/exclude globs, outside sparse-checkout
+        cones are left alone. Globs are matched by git against paths from the working tree root.
+        """
+        pathspecs = list(pathspecs) + [f":(top,glob){pattern}" for pattern in includes]
+        pathspecs += [f":(top,exclude,glob){pattern}" for pattern in excludes]
+        fatobjs = self.get_indexed_fatobjs(pathspecs=pathspecs, skip_sparse=True, cwd=cwd)
+        if len(fatobjs) == 0:
+            self.verbose("git-fat pull: no fat objects match given paths", force=True)
+            return
+        self.pull_fatojbs(fatobjs)
+
+    def upload_fatobj(self, fatid: str, remote_fatfiles: Set[str]) -> None:
+        """
+        Uploads a cached fat object, for chunked objects only chunks missing on remote are sent
+        """
+        if self.has_object(fatid):
+            self.fatstore.upload(str(self.object_path(fatid)))
+            return
+
+        missing_chunks = [chunkid for chunkid, _ in self.read_recipe(fatid) if chunkid not in remote_fatfiles]
+        self.verbose(f"git-fat push: uploading {len(missing_chunks)} missing chunks of {fatid}")
+        for chunkid in dict.fromkeys(missing_chunks):
+            self.fatstore.upload(str(self.object_path(chunkid)))
+            remote_fatfiles.add(chunkid)
+        # recipe goes last, so its presence on remote implies all of its chunks are there
+        self.fatstore.upload(str(self.recipe_path(fatid)))
+
+    def push_fatobjs(self, objects: List[FatObj], remote_fatfiles: Optional[Set[str]] = None):
         if len(objects) == 0:
             self.verbose("git-fat push: nothing to push", force=True)
             return
 
-        for obj in objects:
+        if remote_fatfiles is None:
+            remote_fatfiles = set(self.fatstore.list())
+        known_remote_fatfiles = remote_fatfiles
+
+        pack_threshold = self.get_pack_threshold()
+        packable = {obj.fatid: obj for obj in objects if obj.size < pack_threshold and self.has_object(obj.fatid)}
+        if len(packable) > 1:
+            self.push_pack(list(packable.values()))
+            objects = [obj for obj in objects if obj.fatid not in packable]
+
+        def upload(obj: FatObj):
             self.verbose(f"git-fat push: uploading {obj.path}", force=True)
-            self.fatstore.upload(str(self.objdir / obj.fatid))
+            self.upload_fatobj(obj.fatid, known_remote_fatfiles)
+
+        unique_objects = list({obj.fatid: obj for obj in objects}.values())
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            list(executor.map(upload, unique_objects))
+        self.remember_remote_fatids({obj.fatid for obj in unique_objects} | set(packable))
+
+    def push_pack(self, objects: List[FatObj]):
+        """
+        Uploads small fat objects concatenated into packs, one pack and one index key per group
+        """
+        candidates = [(obj.fatid, self.object_path(obj.fatid), obj.size) for obj in objects]
+        for group in group_for_packing(candidates):
+            with tempfile.TemporaryDirectory(dir=self.packdir) as tmpdir:
+                pack_path, index_path = write_pack(group, Path(tmpdir))
+                self.verbose(f"git-fat push: uploading {len(group)} objects as {pack_path.name}", force=True)
+                # index goes last, so its presence on remote implies the pack is complete
+                self.fatstore.upload(str(pack_path))
+                self.fatstore.upload(str(index_path))
+                shutil.copy2(index_path, self.packdir / index_path.name)
 
     def push(self):
-        local_fatfiles = os.listdir(self.objdir)
-        remote_fatfiles = self.fatstore.list()
+        local_fatfiles = self.get_local_objects()
+        remote_fatfiles = set(self.fatstore.list())
+        self.write_remote_cache(self.get_remote_fatids(remote_fatfiles))
         idx_fatojbs = self.get_indexed_fatobjs()
 
-        push_candidates = [fatobj for fatobj in idx_fatojbs if fatobj.fatid in local_fatfiles]
+        push_candidates = [
+            fatobj
+            for fatobj in idx_fatojbs
+            if fatobj.fatid in local_fatfiles or (fatobj.fatid + RECIPE_SUFFIX) in local_fatfiles
+        ]
         if len(push_candidates) == 0:
             self.verbose("git-fat push: nothing to push", force=True)
             return
 
-        needs_pushing = [fatobj for fatobj in push_candidates if fatobj.fatid not in remote_fatfiles]
-        self.push_fatobjs(needs_pushing)
+        needs_pushing = [fatobj for fatobj in push_candidates if not self.is_on_remote(fatobj.fatid, remote_fatfiles)]
+        self.push_fatobjs(needs_pushing, remote_fatfiles)
+
+    def is_known_object(self, sha: str) -> bool:
+        try:
+            self.gitapi.git.cat_file("-e", sha)
+            return True
+        except GitCommandError:
+            return False
+
+    def pre_push(self, remote: str, updates: List[Tuple[str, str, str, str]]) -> None:
+        """
+        Takes remote name and git pre-push ref updates (local ref, local sha, remote ref, remote sha),
+        uploads fat objects introduced by the pushed commits that are not on the fatstore yet
+        """
+        local_shas = [local_sha for _, local_sha, _, _ in updates if local_sha != ZERO_SHA]
+        if len(local_shas) == 0:
+            self.verbose("git-fat pre-push: nothing to push")
+            return
+
+        remote_shas = [
+            remote_sha
+            for _, _, _, remote_sha in updates
+            if remote_sha != ZERO_SHA and self.is_known_object(remote_sha)
+        ]
+        rev_args = local_shas + ["--not"] + remote_shas + [f"--remotes={remote}"]
+        fatobjs = self.get_fatobjs_in_revs(rev_args)
+        push_candidates = []
+        for fatobj in fatobjs:
+            if not self.is_fatobj_cached(fatobj.fatid):
+                self.verbose(f"git-fat pre-push: {fatobj.path} not found in local cache, skipping", force=True)
+                continue
+            push_candidates.append(fatobj)
+
+        remote_fatfiles = set(self.fatstore.list())
+        needs_pushing = [fatobj for fatobj in push_candidates if not self.is_on_remote(fatobj.fatid, remote_fatfiles)]
+        self.push_fatobjs(needs_pushing, remote_fatfiles)
+
+    def probe_remote(self, fatids: Set[str]) -> Set[str]:
+        """
+        Returns the fatids found on remote with per object HEAD requests instead of a full listing,
+        only pack indexes are listed (by key prefix) and only when an object is not stored on its own
+        """
+        pack_lock = threading.Lock()
+
+        def probe(fatid: str) -> bool:
+            if self.fatstore.exists(fatid) or self.fatstore.exists(fatid + RECIPE_SUFFIX):
+                return True
+            with pack_lock:
+                if self._pack_index is None:
+                    self.get_pack_index(set(self.fatstore.list(PACK_PREFIX)))
+            return fatid in self._pack_index  # type: ignore
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            found = executor.map(probe, sorted(fatids))
+            return {fatid for fatid, present in zip(sorted(fatids), found) if present}
+
+    def get_present_fatids(self, fatids: Set[str]) -> Set[str]:
+        """
+        Returns the fatids found on remote, small sets are probed per object, large ones use one full listing
+        """
+        if len(fatids) <= PROBE_LIMIT:
+            present = self.probe_remote(fatids)
+        else:
+            remote_fatfiles = set(self.fatstore.list())
+            present = {fatid for fatid in fatids if self.is_on_remote(fatid, remote_fatfiles)}
+        self.remember_remote_fatids(present)
+        return present
+
+    def get_remote_cache_key(self) -> str:
+        """
+        Returns a digest of the fatstore configuration, remote knowledge recorded for another fatstore is ignored
+        """
+        store_config = self.gitfat_config[self.get_fatstore_type()]
+        return hashlib.sha1(repr(sorted(store_config.items())).encode()).hexdigest()
+
+    def read_remote_cache(self) -> Optional[Set[str]]:
+        """
+        Returns fatids last known to be on the fatstore, None if nothing was recorded for the current fatstore
+        """
+        if not self.remote_cache_path.exists():
+            return None
+        lines = self.remote_cache_path.read_text().splitlines()
+        if not lines or lines[0] != self.get_remote_cache_key():
+            return None
+        return set(lines[1:])
+
+    def write_remote_cache(self, fatids: Set[str]) -> None:
+        fd, tmpfile_path = tempfile.mkstemp(dir=self.remote_cache_path.parent)
+        with os.fdopen(fd, "w") as cache_handle:
+            cache_handle.write(self.get_remote_cache_key() + "\n")
+            cache_handle.writelines(f"{fatid}\n" for fatid in sorted(fatids))
+        os.replace(tmpfile_path, self.remote_cache_path)
+
+    def remember_remote_fatids(self, fatids: Set[str]) -> None:
+        known = self.read_remote_cache()
+        if known is None or not fatids <= known:
+            self.write_remote_cache((known or set()) | fatids)
+
+    def get_remote_fatids(self, remote_fatfiles: Set[str]) -> Set[str]:
+        """
+        Returns fatids restorable from a fatstore listing: whole objects, chunk recipes and packed objects
+        """
+        fatids = {name[: -len(RECIPE_SUFFIX)] if name.endswith(RECIPE_SUFFIX) else name for name in remote_fatfiles}
+        return {fatid for fatid in fatids if OBJECT_NAME.fullmatch(fatid)} | set(self.get_pack_index(remote_fatfiles))
+
+    def refresh_remote_cache(self) -> Set[str]:
+        fatids = self.get_remote_fatids(set(self.fatstore.list()))
+        self.write_remote_cache(fatids)
+        return fatids
 
     def confirm_on_remote(self, search_list: Set[FatObj]) -> None:
-        remote_fatfiles = self.fatstore.list()
-        missing_fatobjs = [fatobj for fatobj in search_list if fatobj.fatid not in remote_fatfiles]
+        present = self.get_present_fatids({fatobj.fatid for fatobj in search_list})
+        missing_fatobjs = [fatobj for fatobj in search_list if fatobj.fatid not in present]
         if len(missing_fatobjs) != 0:
             for missing_obj in missing_fatobjs:
                 self.verbose(f"git-fat: {missing_obj.path} not found on remote store", force=True)
@@ -359,6 +1335,90 @@ class FatRepo:
             added_fatobjs.add(self.create_fatobj(new_blob))
         return added_fatobjs
 
+    def resolve_ref_ranges(self, refs: List[str], target: Optional[str] = None) -> List[Tuple[str, str, str]]:
+        """
+        Returns (ref, base tree, target tree) for each REF or rev range (BASE..TARGET), a plain REF is compared
+        against target, defaulting to the working index. All trees are resolved with one `git rev-parse` call.
+        """
+        target_tree = self.gitapi.git.write_tree() if target is None else f"{target}^{{tree}}"
+        pairs = []
+        for ref in refs:
+            if ".." in ref and "..." not in ref:
+                base, ref_target = ref.split("..", 1)
+                pairs.append((ref, f"{base or 'HEAD'}^{{tree}}", f"{ref_target or 'HEAD'}^{{tree}}"))
+            else:
+                pairs.append((ref, f"{ref}^{{tree}}", target_tree))
+        names = list(dict.fromkeys(name for _, base, ref_target in pairs for name in (base, ref_target)))
+        trees = dict(zip(names, self.gitapi.git.rev_parse(*names).split()))
+        return [(ref, trees[base], trees[ref_target]) for ref, base, ref_target in pairs]
+
+    def get_added_fatobjs_by_ref(self, refs: List[str], target: Optional[str] = None) -> Dict[str, Set[FatObj]]:
+        """
+        Returns map of REF -> FatObjs added in target (default: working index) vs REF, for many REFs at once
+        Every tree pair is diffed by a single `git diff-tree --stdin` process and fat stubs shared between REFs
+        are read only once
+        """
+        resolved = self.resolve_ref_ranges(refs, target)
+        queries = list(dict.fromkeys(f"{base} {ref_target}" for _, base, ref_target in resolved))
+        output = subprocess.run(
+            ["git", "diff-tree", "--stdin", "-r", "-z", "--no-renames", "--diff-filter=A"],
+            cwd=str(self.workspace),
+            input=("\n".join(queries) + "\n").encode(),
+            stdout=subprocess.PIPE,
+            check=True,
+        ).stdout.decode("utf-8", "surrogateescape")
+
+        added: Dict[str, List[Tuple[str, str]]] = {query: [] for query in queries}
+        query = ""
+        position = 0
+        while position < len(output):
+            if output[position] != ":":
+                header_end = output.index("\n", position)
+                query = output[position:header_end]
+                position = header_end + 1
+                continue
+            info_end = output.index("\0", position)
+            path_end = output.index("\0", info_end + 1)
+            _, mode, _, sha, _ = output[position + 1 : info_end].split()
+            if mode.startswith("100"):
+                added[query].append((sha, output[info_end + 1 : path_end]))
+            position = path_end + 1
+
+        shas = {sha for entries in added.values() for sha, _ in entries}
+        candidates = [sha for sha, _, size in batch_check(self.workspace, shas) if size == self.magiclen]
+        fatstubs = {}
+        for sha, data in read_blobs(self.workspace, candidates):
+            if self.is_fatstub(data):
+                fatstubs[sha] = self.decode_fatstub(tostr(data))
+
+        added_fatobjs = {}
+        for ref, base, ref_target in resolved:
+            added_fatobjs[ref] = {
+                FatObj(fatid=fatstubs[sha][0], path=path, size=fatstubs[sha][1])
+                for sha, path in added[f"{base} {ref_target}"]
+                if sha in fatstubs
+            }
+        return added_fatobjs
+
+    def fatstore_check_refs(self, refs: List[str]) -> None:
+        """
+        Checks FatObjs added to the working index vs each REF (or in each rev range) are on remote,
+        remote presence is checked once for the union of all REFs
+        """
+        added_fatobjs = self.get_added_fatobjs_by_ref(refs)
+        union = set().union(*added_fatobjs.values())
+        present = self.get_present_fatids({fatobj.fatid for fatobj in union})
+        missing_refs = 0
+        for ref, fatobjs in added_fatobjs.items():
+            missing = sorted(fatobj.path for fatobj in fatobjs if fatobj.fatid not in present)
+            status = "ok" if not missing else f"{len(missing)} missing"
+            self.verbose(f"git-fat fscheck-new: {ref}: {len(fatobjs)} new fat objects, {status}", force=True)
+            for path in missing:
+                self.verbose(f"git-fat: {path} not found on remote store", force=True)
+            missing_refs += 1 if missing else 0
+        if missing_refs:
+            sys.exit(1)
+
     @singledispatchmethod
     def fatstore_check(self, arg):
         raise NotImplementedError(f"Cannot format value of type {type(arg)}")
@@ -369,9 +1429,15 @@ class FatRepo:
     ) -> None:
         if len(files) == 0:
             return
-        fatobjs = self.get_indexed_fatobjs()
-        requested_abspaths = [str(fpath.absolute()) for fpath in files]
-        fatobjs_to_find = {o for o in fatobjs if o.abspath in requested_abspaths}
+        rpaths = []
+        for fpath in files:
+            try:
+                rpaths.append(str(fpath.absolute().relative_to(self.workspace)))
+            except ValueError:
+                continue
+        if len(rpaths) == 0:
+            return
+        fatobjs_to_find = self.get_indexed_fatobjs(pathspecs=[f":(top,literal){rpath}" for rpath in rpaths])
         self.confirm_on_remote(fatobjs_to_find)
 
     @fatstore_check.register(NoArgs)
@@ -391,15 +1457,331 @@ class FatRepo:
         Takes REF, finds new fatobjs in REF but not in HEAD and uploads to smudge store
         """
         head = self.gitapi.head.commit
-        added_fatobjs = self.get_added_fatobjs(ref, head)
+        self.publish_fatobjs(self.get_added_fatobjs(ref, head))
+
+    def publish_added_fatobjs_refs(self, refs: List[str]) -> None:
+        """
+        Takes REFs or rev ranges, publishes the union of fatobjs new in HEAD (or range target) to smudge store
+        """
+        added_fatobjs = self.get_added_fatobjs_by_ref(refs, "HEAD")
+        for ref, fatobjs in added_fatobjs.items():
+            self.verbose(f"git-fat fspublish-new: {ref}: {len(fatobjs)} new fat objects", force=True)
+        self.publish_fatobjs(set().union(*added_fatobjs.values()))
+
+    def publish_fatobjs(self, added_fatobjs: Set[FatObj]) -> None:
         for fatobj in added_fatobjs:
-            fpath = Path(fatobj.abspath)
-            keyname = str(fpath.relative_to(self.workspace))
-            fatobj_cache_path = self.objdir / fatobj.fatid
-            if not fatobj_cache_path.exists():
+            fpath = Path(self.get_abspath(fatobj))
+            keyname = fatobj.path
+            fatobj_cache_path = self.object_path(fatobj.fatid)
+            if not self.is_fatobj_cached(fatobj.fatid):
                 self.pull(files=[fpath])
             self.verbose(f"git-fat: publishing '{keyname}' to smudgestore", force=True)
-            self.smudgestore.upload(local_filename=str(fatobj_cache_path), remote_filename=keyname)
+            if fatobj_cache_path.exists():
+                self.smudgestore.upload(local_filename=str(fatobj_cache_path), remote_filename=keyname)
+                continue
+            # smudge store serves whole files, reassemble chunked objects before uploading
+            with tempfile.TemporaryDirectory(dir=self.objdir) as tmpdir:
+                assembled = Path(tmpdir) / fatobj.fatid
+                self.assemble_fatobj(fatobj.fatid, assembled)
+                self.smudgestore.upload(local_filename=str(assembled), remote_filename=keyname)
+
+    def get_referenced_remote_files(self, fatids: Set[str], remote_fatfiles: Set[str]) -> Set[str]:
+        """
+        Returns fatstore keys needed to restore fatids: whole objects, recipes with their chunks and packs
+        holding at least one of the fatids
+        """
+        referenced = fatids & remote_fatfiles
+        for fatid in fatids:
+            recipe_name = fatid + RECIPE_SUFFIX
+            if recipe_name not in remote_fatfiles:
+                continue
+            referenced.add(recipe_name)
+            if not self.has_object(recipe_name):
+                self.download_object(recipe_name)
+            referenced.update(chunkid for chunkid, _ in self.read_recipe(fatid))
+
+        pack_index = self.get_pack_index(remote_fatfiles)
+        for fatid in fatids & pack_index.keys():
+            name = pack_index[fatid][0]
+            referenced.update([name, name[: -len(PACK_SUFFIX)] + INDEX_SUFFIX])
+        return referenced
+
+    def get_unreferenced_remote_files(self, rev_args: Optional[List[str]] = None) -> List[str]:
+        """
+        Returns fatstore keys not needed by any FatObj in history of rev_args (default: all refs)
+        """
+        remote_fatfiles = set(self.fatstore.list())
+        history_fatids = {fatobj.fatid for fatobj in self.get_history_fatobjs(rev_args)}
+        referenced = self.get_referenced_remote_files(history_fatids, remote_fatfiles)
+        return sorted(remote_fatfiles - referenced)
+
+    def get_prune_rev_args(self, refs: Optional[List[str]] = None) -> List[str]:
+        """
+        Converts refs (CLI or prune_refs in gitfat config) to rev-list arguments, defaults to all refs
+        I.E. ["refs/heads/*", "--remotes=origin", "v1.0"] -> ["--glob=refs/heads/*", "--remotes=origin", "v1.0"]
+        """
+        if not refs:
+            refs = self.gitfat_config[self.get_fatstore_type()].get("prune_refs", [])
+        if not refs:
+            return ["--all"]
+        return [ref if ref.startswith("-") or not set("*?[") & set(ref) else f"--glob={ref}" for ref in refs]
+
+    def prune_remote(
+        self, refs: Optional[List[str]] = None, grace_days: Optional[float] = None, dry_run: bool = False
+    ) -> Tuple[int, int]:
+        """
+        Deletes fatstore objects not needed by history of refs and older than grace_days
+        The store is listed twice, first for recipes and pack indexes only, then streamed into batched deletes,
+        so memory stays bounded by the number of referenced objects. Returns (object count, bytes) reclaimed.
+        """
+        if grace_days is None:
+            grace_days = self.gitfat_config[self.get_fatstore_type()].get("prune_grace_days", DEFAULT_PRUNE_GRACE_DAYS)
+        history_fatids = {fatobj.fatid for fatobj in self.get_history_fatobjs(self.get_prune_rev_args(refs))}
+        indexes = {
+            name for name, _, _ in self.fatstore.list_details() if name.endswith(RECIPE_SUFFIX) or is_pack_index(name)
+        }
+        keep = history_fatids | self.get_referenced_remote_files(history_fatids, indexes)
+        cutoff = datetime.now(timezone.utc) - timedelta(days=float(grace_days))
+
+        pruned_count = 0
+        pruned_bytes = 0
+        batch: List[str] = []
+        failed: List[str] = []
+        for name, size, last_modified in self.fatstore.list_details():
+            if name in keep or last_modified > cutoff:
+                continue
+            pruned_count += 1
+            pruned_bytes += size
+            self.verbose(f"git-fat prune-remote: {'would delete' if dry_run else 'deleting'} {name}")
+            if dry_run:
+                continue
+            batch.append(name)
+            if len(batch) == DELETE_BATCH_SIZE:
+                failed.extend(self.fatstore.delete_many(batch))
+                batch = []
+        if batch:
+            failed.extend(self.fatstore.delete_many(batch))
+        if pruned_count and not dry_run:
+            # deleted objects may still be listed as present, forget everything known about the remote
+            self.remote_cache_path.unlink(missing_ok=True)
+        for name in failed:
+            self.verbose(f"git-fat prune-remote: failed to delete {name}", force=True)
+
+        action = "would reclaim" if dry_run else "reclaimed"
+        self.verbose(f"git-fat prune-remote: {action} {pruned_bytes} bytes in {pruned_count} objects", force=True)
+        return pruned_count, pruned_bytes
+
+    def get_cached_files(self, fatid: str) -> List[str]:
+        """
+        Returns names of the local cache files backing fatid, the whole object or its recipe and chunks
+        """
+        if self.has_object(fatid):
+            return [fatid]
+        if self.is_fatobj_cached(fatid):
+            return [fatid + RECIPE_SUFFIX] + [chunkid for chunkid, _ in self.read_recipe(fatid)]
+        return []
+
+    def create_bundle(self, fatobjs: Set[FatObj], output_handle: IO) -> None:
+        """
+        Writes a streaming tar archive of cached fat objects to output_handle, led by an index of
+        names, sizes and sha1 checksums
+        """
+        names = {}
+        for fatobj in fatobjs:
+            cached_files = self.get_cached_files(fatobj.fatid)
+            if not cached_files:
+                self.verbose(f"git-fat bundle: {fatobj.path} not found in local cache, skipping", force=True)
+            names.update(dict.fromkeys(cached_files))
+
+        entries: List[BundleEntry] = []
+        for name in names:
+            path = self.object_path(name)
+            # cached objects are named after their sha1, recipes are the only files needing a checksum pass
+            checksum = file_sha1(path) if name.endswith(RECIPE_SUFFIX) else name
+            entries.append((name, path.stat().st_size, checksum))
+
+        index = encode_bundle_index(entries)
+        with tarfile.open(fileobj=output_handle, mode="w|") as bundle:
+            index_info = tarfile.TarInfo(BUNDLE_INDEX)
+            index_info.size = len(index)
+            bundle.addfile(index_info, io.BytesIO(index))
+            for name, _, _ in entries:
+                bundle.add(str(self.object_path(name)), arcname=BUNDLE_OBJECTS + name, recursive=False)
+        self.verbose(f"git-fat bundle: wrote {len(entries)} objects", force=True)
+
+    def verify_and_place(self, tmpfile_path: str, name: str, checksum: str) -> bool:
+        if file_sha1(Path(tmpfile_path)) != checksum:
+            os.remove(tmpfile_path)
+            self.verbose(f"git-fat unbundle: checksum mismatch for {name}", force=True)
+            return False
+        self.cache_fatfile(tmpfile_path, name)
+        return True
+
+    def unbundle(self, input_handle: IO) -> None:
+        """
+        Reads a bundle stream into the local cache, each member is written once to a temp file inside the
+        cache and renamed into place after its checksum is verified on a worker thread
+        """
+        verified = []
+        with tarfile.open(fileobj=input_handle, mode="r|") as bundle, ThreadPoolExecutor() as executor:
+            checksums = {}
+            for member in bundle:
+                if member.name == BUNDLE_INDEX:
+                    index = bundle.extractfile(member).read()  # type: ignore
+                    checksums = {name: checksum for name, _, checksum in decode_bundle_index(index)}
+                    continue
+
+                name = member.name[len(BUNDLE_OBJECTS) :]
+                if not member.isfile() or not member.name.startswith(BUNDLE_OBJECTS) or name not in checksums:
+                    self.verbose(f"git-fat unbundle: unexpected member {member.name}, skipping", force=True)
+                    continue
+                if not OBJECT_NAME.fullmatch(name):
+                    self.verbose(f"git-fat unbundle: unexpected member {member.name}, skipping", force=True)
+                    continue
+                if self.has_object(name):
+                    self.verbose(f"git-fat unbundle: {name} already cached")
+                    continue
+
+                fd, tmpfile_path = tempfile.mkstemp(dir=self.objdir)
+                with os.fdopen(fd, "wb") as tmpfile_handle:
+                    shutil.copyfileobj(bundle.extractfile(member), tmpfile_handle, BLOCK_SIZE * 256)  # type: ignore
+                verified.append(executor.submit(self.verify_and_place, tmpfile_path, name, checksums[name]))
+
+        failures = [future for future in verified if not future.result()]
+        self.verbose(f"git-fat unbundle: imported {len(verified) - len(failures)} objects", force=True)
+        if failures:
+            sys.exit(1)
+
+    def clean_blob(self, sha: str) -> Optional[Tuple[str, str, int]]:
+        """
+        Caches the contents of a git blob as a fat object, returns the sha of its stub blob with the fatid and
+        size, or None if the blob already is a fat stub
+        """
+        with subprocess.Popen(
+            ["git", "cat-file", "blob", sha], cwd=str(self.workspace), stdout=subprocess.PIPE
+        ) as cat_file:
+            first_block = cat_file.stdout.read(BLOCK_SIZE)  # type: ignore
+            if self.is_fatstub(first_block):
+                cat_file.stdout.read()  # type: ignore
+                return None
+            chunking = self.get_chunking_config()
+            if chunking:
+                fatid, size = self.clean_chunked(first_block, cat_file.stdout, chunking)
+            else:
+                fatid, size = self.clean_stream(first_block, cat_file.stdout)
+        if cat_file.returncode != 0:
+            raise subprocess.CalledProcessError(cat_file.returncode, cat_file.args)
+        with self._odb_lock:
+            return self.write_stub_blob(fatid, size), fatid, size
+
+    def get_fat_attributed_blobs(self, rev_args: List[str], attributes: AttributeChecker) -> Iterator[str]:
+        """
+        Yields blobs reachable from rev_args whose first path seen by rev-list has the fat filter attribute
+        """
+        for sha, _, _, path in iter_objects(self.workspace, rev_args):
+            if path and attributes.get(path.encode("utf-8", "surrogateescape")) == "fat":
+                yield sha
+
+    def import_history(self, rev_args: Optional[List[str]] = None, push: bool = False) -> Set[FatObj]:
+        """
+        Rewrites history of rev_args (default: all REFs) in one `git fast-export | rewrite | git fast-import`
+        pass, replacing blobs at paths with the fat filter attribute (as configured now) by their fat stubs.
+        Every blob is cleaned once, those found by a first object walk in parallel while the stream is rewritten.
+        Returns the FatObjs imported, pushed to the fatstore with push.
+        """
+        if self.gitapi.is_dirty(index=True, working_tree=False):
+            self.verbose("git-fat import-history: commit or unstage staged changes first", force=True)
+            sys.exit(1)
+        rev_args = rev_args or ["--all"]
+        cleaned: Dict[str, Future] = {}
+        imported: Dict[str, FatObj] = {}
+
+        with AttributeChecker(self.workspace, "filter") as attributes, ThreadPoolExecutor(self.jobs) as executor:
+
+            def clean(sha: str) -> Future:
+                if sha not in cleaned:
+                    cleaned[sha] = executor.submit(self.clean_blob, sha)
+                return cleaned[sha]
+
+            for sha in self.get_fat_attributed_blobs(rev_args, attributes):
+                clean(sha)
+            self.verbose(f"git-fat import-history: cleaning {len(cleaned)} blobs", force=True)
+
+            def replace_blob(sha: str, path: bytes) -> Optional[str]:
+                if attributes.get(path) != "fat":
+                    return None
+                result = clean(sha).result()
+                if result is None:
+                    return None
+                stub_sha, fatid, size = result
+                imported.setdefault(
+                    fatid, FatObj(fatid=fatid, path=path.decode("utf-8", "surrogateescape"), size=size)
+                )
+                return stub_sha
+
+            if not rewrite_history(self.workspace, rev_args, replace_blob):
+                self.verbose("git-fat import-history: rewriting history failed", force=True)
+                sys.exit(1)
+
+        # the index still holds the original blobs, the worktree is left alone
+        subprocess.run(["git", "reset", "-q"], cwd=str(self.workspace), check=True)
+        self.verbose(f"git-fat import-history: imported {len(imported)} fat objects", force=True)
+        if push:
+            self.push_fatobjs(list(imported.values()))
+        return set(imported.values())
+
+    def get_needed_local_files(self, fatids: Set[str]) -> Set[str]:
+        """
+        Returns names of the local cache files backing fatids: whole objects, recipes and their chunks
+        """
+        local_objects = self.get_local_objects()
+        needed = set(fatids)
+        for fatid in fatids:
+            recipe_name = fatid + RECIPE_SUFFIX
+            if recipe_name in local_objects:
+                needed.add(recipe_name)
+                needed.update(chunkid for chunkid, _ in self.read_recipe(fatid))
+        return needed
+
+    def status(self, refresh_remote: bool = False) -> FatStatus:
+        """
+        Returns worktree files that are still stubs, cached objects no REF or index entry references, and
+        referenced cached objects not known to be on the fatstore. Index, history and remote knowledge come from
+        local caches, the fatstore is only listed with refresh_remote.
+        """
+        indexed = self.get_cached_indexed_fatobjs()
+        referenced = {fatobj.fatid: fatobj for fatobj in self.get_history_fatobjs()}
+        referenced.update((fatobj.fatid, fatobj) for fatobj in indexed)
+
+        result = FatStatus()
+        result.stubs = sorted((obj for obj in indexed if self.is_worktree_stub(obj)), key=lambda obj: obj.path)
+
+        local_objects = self.get_local_objects()
+        orphans = local_objects - self.get_needed_local_files(set(referenced))
+        result.orphans = sorted((name, self.object_path(name).stat().st_size) for name in orphans)
+
+        remote_fatids = self.refresh_remote_cache() if refresh_remote else self.read_remote_cache()
+        if remote_fatids is not None:
+            result.unpushed = sorted(
+                (
+                    fatobj
+                    for fatid, fatobj in referenced.items()
+                    if fatid not in remote_fatids
+                    and (fatid in local_objects or fatid + RECIPE_SUFFIX in local_objects)
+                ),
+                key=lambda obj: obj.path,
+            )
+        return result
+
+
+_ingest_repo: Optional[FatRepo] = None
+
+
+def _init_ingest_worker(workspace: Path) -> None:
+    global _ingest_repo
+    _ingest_repo = FatRepo(workspace)
+
 
-    # def status(self):
-    #     pass
+def _ingest_file(path: str) -> Tuple[str, str, int, Optional[StatEntry]]:
+    assert _ingest_repo is not None
+    return _ingest_repo.ingest_file(path)
@@ -0,0 +1,26 @@
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+from .fatobj import FatObj
+
+
+@dataclass
+class FatStatus:
+    """
+    Local fat object state of a repository. unpushed is None while nothing is known about the remote yet.
+    """
+
+    stubs: List[FatObj] = field(default_factory=list)
+    orphans: List[Tuple[str, int]] = field(default_factory=list)
+    unpushed: Optional[List[FatObj]] = None
+
+    @property
+    def stub_bytes(self) -> int:
+        return sum(obj.size for obj in self.stubs)
+
+    @property
+    def orphan_bytes(self) -> int:
+        return sum(size for _, size in self.orphans)
+
+    @property
+    def unpushed_bytes(self) -> int:
+        return sum(obj.size for obj in self.unpushed or [])
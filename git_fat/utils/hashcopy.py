@@ -0,0 +1,92 @@
+import errno
+import hashlib
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import IO, List, Optional, Tuple
+
+BUFFER_SIZE = 8 * 1024 * 1024
+BUFFER_COUNT = 3
+COPY_STEP = 64 * 1024 * 1024
+UNSUPPORTED_COPY_ERRNOS = {errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF}
+
+
+def hash_copy_stream(
+    input_handle: IO, output_handle: IO, first_block: bytes = b"", buffer_size: int = BUFFER_SIZE
+) -> Tuple["hashlib._Hash", int]:
+    """
+    Copies input stream to output handle, returns sha1 and size of the copied bytes.
+    Reads go into a ring of reusable buffers and SHA1 runs on a worker thread (hashlib releases the GIL),
+    so hashing a buffer overlaps with writing it and reading the next one.
+    """
+    sha = hashlib.new("sha1")
+    sha.update(first_block)
+    output_handle.write(first_block)
+    size = len(first_block)
+
+    buffers = [memoryview(bytearray(buffer_size)) for _ in range(BUFFER_COUNT)]
+    pending: List[Optional[Future]] = [None] * BUFFER_COUNT
+    with ThreadPoolExecutor(max_workers=1) as hasher:
+        index = 0
+        while True:
+            # a buffer is only refilled once the worker is done hashing it
+            if pending[index] is not None:
+                pending[index].result()  # type: ignore
+            read_size = input_handle.readinto(buffers[index])
+            if not read_size:
+                break
+            block = buffers[index][:read_size]
+            pending[index] = hasher.submit(sha.update, block)
+            output_handle.write(block)
+            size += read_size
+            index = (index + 1) % BUFFER_COUNT
+
+        for future in pending:
+            if future is not None:
+                future.result()
+    return sha, size
+
+
+def _hash_range(sha: "hashlib._Hash", fd: int, buffer: memoryview, offset: int, length: int) -> None:
+    end = offset + length
+    while offset < end:
+        read_size = os.preadv(fd, [buffer[: min(len(buffer), end - offset)]], offset)
+        if not read_size:
+            raise OSError(errno.EIO, "Copied range shorter than reported")
+        sha.update(buffer[:read_size])
+        offset += read_size
+
+
+def hash_copy_file(
+    source_fd: int, destination_fd: int, step: int = COPY_STEP, buffer_size: int = BUFFER_SIZE
+) -> Optional[Tuple["hashlib._Hash", int]]:
+    """
+    Copies a file with os.copy_file_range, which stays in the kernel and shares extents on filesystems that
+    support it. A worker thread hashes what landed in destination one step behind the copy, so the returned
+    sha1 always matches the copied bytes even if the source changes meanwhile.
+    Returns None, before copying anything, when copy_file_range isn't supported for these files.
+        Parameters:
+            destination_fd: must be open for reading and writing
+    """
+    if not hasattr(os, "copy_file_range"):
+        return None
+
+    sha = hashlib.new("sha1")
+    hash_buffer = memoryview(bytearray(buffer_size))
+    size = 0
+    futures = []
+    with ThreadPoolExecutor(max_workers=1) as hasher:
+        while True:
+            try:
+                copied = os.copy_file_range(source_fd, destination_fd, step)
+            except OSError as e:
+                if size == 0 and e.errno in UNSUPPORTED_COPY_ERRNOS:
+                    return None
+                raise
+            if not copied:
+                break
+            futures.append(hasher.submit(_hash_range, sha, destination_fd, hash_buffer, size, copied))
+            size += copied
+
+        for future in futures:
+            future.result()
+    return sha, size
@@ -0,0 +1,94 @@
+import hashlib
+from pathlib import Path
+from typing import List, Tuple
+
+PACK_PREFIX = "pack-"
+PACK_SUFFIX = ".pack"
+INDEX_SUFFIX = ".idx"
+PACK_MAX_SIZE = 64 * 1024 * 1024
+RANGE_GAP = 64 * 1024
+
+PackEntry = Tuple[str, int, int]
+
+
+def is_pack_index(name: str) -> bool:
+    return name.startswith(PACK_PREFIX) and name.endswith(INDEX_SUFFIX)
+
+
+def pack_name(index_name: str) -> str:
+    """
+    Returns the pack blob name for a pack index name, I.E. pack-<sha>.idx -> pack-<sha>.pack
+    """
+    return index_name[: -len(INDEX_SUFFIX)] + PACK_SUFFIX
+
+
+def encode_pack_index(entries: List[PackEntry]) -> bytes:
+    """
+    Returns pack index bytes, one "fatid offset size" line per packed fat object
+    """
+    return "".join("%s %d %d\n" % entry for entry in entries).encode()
+
+
+def decode_pack_index(data: bytes) -> List[PackEntry]:
+    entries = []
+    for line in data.decode().splitlines():
+        fatid, offset, size = line.split()
+        entries.append((fatid, int(offset), int(size)))
+    return entries
+
+
+def group_for_packing(
+    objects: List[Tuple[str, Path, int]], max_size: int = PACK_MAX_SIZE
+) -> List[List[Tuple[str, Path]]]:
+    """
+    Takes (fatid, cache path, size) tuples, returns groups whose combined size stays under max_size
+    """
+    groups: List[List[Tuple[str, Path]]] = [[]]
+    group_size = 0
+    for fatid, path, size in objects:
+        if groups[-1] and group_size + size > max_size:
+            groups.append([])
+            group_size = 0
+        groups[-1].append((fatid, path))
+        group_size += size
+    return [group for group in groups if group]
+
+
+def write_pack(objects: List[Tuple[str, Path]], directory: Path) -> Tuple[Path, Path]:
+    """
+    Concatenates cached fat objects into a pack file with its offset index, both named after the sha1 of the index
+    Returns paths of the written pack and index
+    """
+    entries = []
+    offset = 0
+    tmp_pack = directory / "tmp.pack"
+    with open(tmp_pack, "wb") as pack_handle:
+        for fatid, path in objects:
+            data = path.read_bytes()
+            pack_handle.write(data)
+            entries.append((fatid, offset, len(data)))
+            offset += len(data)
+
+    index = encode_pack_index(entries)
+    name = PACK_PREFIX + hashlib.sha1(index).hexdigest()
+    pack_path = directory / (name + PACK_SUFFIX)
+    index_path = directory / (name + INDEX_SUFFIX)
+    tmp_pack.rename(pack_path)
+    index_path.write_bytes(index)
+    return pack_path, index_path
+
+
+def coalesce_ranges(entries: List[PackEntry], gap: int = RANGE_GAP) -> List[Tuple[int, int, List[PackEntry]]]:
+    """
+    Merges pack entries lying within gap bytes of each other, so neighbouring objects are fetched by a single
+    ranged GET. Returns (start, end, entries) tuples, end is exclusive.
+    """
+    ranges: List[Tuple[int, int, List[PackEntry]]] = []
+    for entry in sorted(entries, key=lambda e: e[1]):
+        _, offset, size = entry
+        if ranges and offset - ranges[-1][1] <= gap:
+            start, end, members = ranges[-1]
+            ranges[-1] = (start, max(end, offset + size), members + [entry])
+            continue
+        ranges.append((offset, offset + size, [entry]))
+    return ranges
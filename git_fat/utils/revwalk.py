@@ -0,0 +1,104 @@
+import subprocess
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+
+BATCH_CHECK_FORMAT = "--batch-check=%(objectname) %(objecttype) %(objectsize) %(rest)"
+BATCH_SIZE = 10000
+
+ObjectInfo = Tuple[str, str, int, str]
+
+
+def iter_objects(
+    repo_dir: Path, rev_args: List[str], max_blob_size: Optional[int] = None, blobs_only: bool = True
+) -> Iterator[ObjectInfo]:
+    """
+    Yields (sha, type, size, path) for every object reachable from rev_args, streaming
+    `git rev-list --objects` straight into one `git cat-file --batch-check` process.
+    rev-list only reports each object once, so trees shared between commits are walked a single time.
+        Parameters:
+            max_blob_size: when given, rev-list drops larger blobs before they reach cat-file
+    """
+    rev_list_cmd = ["git", "rev-list", "--objects"]
+    if max_blob_size is not None:
+        rev_list_cmd.append(f"--filter=blob:limit={max_blob_size + 1}")
+    rev_list_cmd.extend(rev_args)
+
+    rev_list = subprocess.Popen(rev_list_cmd, cwd=str(repo_dir), stdout=subprocess.PIPE)
+    batch_check = subprocess.Popen(
+        ["git", "cat-file", BATCH_CHECK_FORMAT],
+        cwd=str(repo_dir),
+        stdin=rev_list.stdout,
+        stdout=subprocess.PIPE,
+    )
+    rev_list.stdout.close()  # type: ignore
+    for line in batch_check.stdout:  # type: ignore
+        sha, objtype, size, *rest = line.decode("utf-8", "surrogateescape").rstrip("\n").split(" ", 3)
+        if blobs_only and objtype != "blob":
+            continue
+        yield sha, objtype, int(size), rest[0] if rest else ""
+
+    batch_check.wait()
+    if rev_list.wait() != 0:
+        raise subprocess.CalledProcessError(rev_list.returncode, rev_list_cmd)
+
+
+def read_blobs(repo_dir: Path, shas: Iterable[str], batch_size: int = BATCH_SIZE) -> Iterator[Tuple[str, bytes]]:
+    """
+    Yields (sha, contents) of given small blobs, read through `git cat-file --batch` in bounded batches
+    """
+    batch: List[str] = []
+    for sha in shas:
+        batch.append(sha)
+        if len(batch) >= batch_size:
+            yield from _read_batch(repo_dir, batch)
+            batch = []
+    if batch:
+        yield from _read_batch(repo_dir, batch)
+
+
+def _read_batch(repo_dir: Path, shas: List[str]) -> Iterator[Tuple[str, bytes]]:
+    output = subprocess.run(
+        ["git", "cat-file", "--batch"],
+        cwd=str(repo_dir),
+        input=("\n".join(shas) + "\n").encode(),
+        stdout=subprocess.PIPE,
+        check=True,
+    ).stdout
+    position = 0
+    for _ in shas:
+        header_end = output.index(b"\n", position)
+        header = output[position:header_end].split()
+        position = header_end + 1
+        if len(header) < 3:
+            continue
+        size = int(header[2])
+        yield header[0].decode(), output[position : position + size]
+        position += size + 1
+
+
+def batch_check(repo_dir: Path, shas: Iterable[str]) -> Iterator[Tuple[str, str, int]]:
+    """
+    Yields (sha, type, size) of given objects present in the object database, checked with one
+    `git cat-file --batch-check`
+    """
+    shas = list(shas)
+    if not shas:
+        return
+    output = subprocess.run(
+        ["git", "cat-file", "--batch-check=%(objectname) %(objecttype) %(objectsize)"],
+        cwd=str(repo_dir),
+        input=("\n".join(shas) + "\n").encode(),
+        stdout=subprocess.PIPE,
+        check=True,
+    ).stdout.decode()
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) == 3:
+            yield parts[0], parts[1], int(parts[2])
+
+
+def existing_objects(repo_dir: Path, shas: Iterable[str]) -> Set[str]:
+    """
+    Returns the subset of shas present in the object database
+    """
+    return {sha for sha, _, _ in batch_check(repo_dir, shas)}
@@ -0,0 +1,49 @@
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+STAT_CACHE = "statcache"
+# files modified this close to being hashed may change again within the same mtime tick, don't trust them
+RACY_NS = 2 * 1000 * 1000 * 1000
+
+StatEntry = Tuple[str, int, int, int, int]
+
+
+def stat_entry(fatid: str, st: os.stat_result) -> StatEntry:
+    """
+    Returns (fatid, size, mtime_ns, ctime_ns, inode) remembered for a hashed file
+    """
+    return fatid, st.st_size, st.st_mtime_ns, st.st_ctime_ns, st.st_ino
+
+
+def is_stat_match(entry: StatEntry, st: os.stat_result) -> bool:
+    return entry[1:] == stat_entry(entry[0], st)[1:]
+
+
+def is_racy(st: os.stat_result, now_ns: Optional[int] = None) -> bool:
+    """
+    Returns true if a file was modified too recently for its stat info to prove its contents are unchanged
+    """
+    now_ns = time.time_ns() if now_ns is None else now_ns
+    return st.st_mtime_ns >= now_ns - RACY_NS
+
+
+def encode_stat_entry(path: str, entry: StatEntry) -> bytes:
+    """
+    Returns a NUL terminated "fatid size mtime_ns ctime_ns inode path" stat cache record
+    """
+    return ("%s %d %d %d %d %s\0" % (*entry, path)).encode("utf-8", "surrogateescape")
+
+
+def decode_stat_cache(data: bytes) -> Dict[str, StatEntry]:
+    """
+    Returns stat entries keyed by path, later records override earlier ones
+    """
+    entries = {}
+    for record in data.split(b"\0"):
+        parts = record.decode("utf-8", "surrogateescape").split(" ", 5)
+        if len(parts) != 6:
+            continue
+        fatid, size, mtime_ns, ctime_ns, inode, path = parts
+        entries[path] = (fatid, int(size), int(mtime_ns), int(ctime_ns), int(inode))
+    return entries
@@ -30,6 +30,13 @@ def test_download_file(workspace, s3_fatstore):
     assert content == "Hello World\n"
 
 
+def test_download_range(workspace, s3_fatstore):
+    test_file = workspace.workspace / "range.txt"
+    test_file.write_text("Hello World\n")
+    s3_fatstore.upload(str(test_file))
+    assert s3_fatstore.download_range("range.txt", 6, 11) == b"World"
+
+
 def test_get_bucket_name():
     from git_fat.fatstores.s3fatstore import get_bucket_name
 
@@ -39,3 +46,24 @@ def test_get_bucket_name():
 
 def test_delete(s3_fatstore):
     s3_fatstore.delete("test.txt")
+
+
+def test_delete_many(workspace, s3_fatstore):
+    names = []
+    for i in range(3):
+        test_file = workspace.workspace / f"delete-{i}.txt"
+        test_file.write_text("delete me\n")
+        s3_fatstore.upload(str(test_file))
+        names.append(f"delete-{i}.txt")
+    assert s3_fatstore.delete_many(names) == []
+    assert not set(names) & set(s3_fatstore.list())
+
+
+def test_exists_and_list_prefix(workspace, s3_fatstore):
+    test_file = workspace.workspace / "exists.txt"
+    test_file.write_text("Hello World\n")
+    s3_fatstore.upload(str(test_file))
+    assert s3_fatstore.exists("exists.txt")
+    assert not s3_fatstore.exists("does-not-exist.txt")
+    assert s3_fatstore.list("exists") == ["exists.txt"]
+    s3_fatstore.delete("exists.txt")
@@ -0,0 +1,146 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from boto3.exceptions import S3UploadFailedError
+from botocore.exceptions import ClientError
+
+from git_fat.fatstores.throttle import (
+    AdaptiveLimiter,
+    Throttle,
+    TokenBucket,
+    backoff_delay,
+    is_retryable,
+    is_throttle,
+)
+
+
+def client_error(code: str, status: int) -> ClientError:
+    return ClientError({"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}}, "GetObject")
+
+
+def test_error_classification():
+    assert is_throttle(client_error("SlowDown", 503))
+    assert is_throttle(client_error("Whatever", 429))
+    assert not is_throttle(client_error("NoSuchKey", 404))
+    assert is_retryable(client_error("InternalError", 500))
+    assert not is_retryable(client_error("AccessDenied", 403))
+    assert not is_retryable(ValueError("not from boto"))
+
+    try:
+        try:
+            raise client_error("SlowDown", 503)
+        except ClientError:
+            raise S3UploadFailedError("Failed to upload")
+    except S3UploadFailedError as error:
+        assert is_throttle(error)
+
+
+def test_backoff_delay():
+    assert backoff_delay(3, base=0.1, cap=20, rng=lambda: 1.0) == pytest.approx(0.8)
+    assert backoff_delay(30, base=0.1, cap=20, rng=lambda: 1.0) == 20
+    assert backoff_delay(3, rng=lambda: 0.0) == 0
+
+
+def test_limiter_aimd():
+    now = [0.0]
+    limiter = AdaptiveLimiter(initial=8, maximum=10, clock=lambda: now[0])
+    limiter.on_success()
+    assert limiter.limit == 8, "grows only while its slots are used up"
+
+    starts = [limiter.acquire() for _ in range(8)]
+    for _ in range(8):
+        limiter.on_success()
+        limiter.release()
+    assert limiter.limit == pytest.approx(9, abs=0.1)
+
+    now[0] += 1
+    limiter.on_congestion(now[0])
+    limiter.on_congestion(starts[0])
+    assert limiter.limit == pytest.approx(4.5, abs=0.1), "requests sent before a decrease don't decrease again"
+    now[0] += 1
+    limiter.on_congestion(now[0])
+    assert limiter.limit == pytest.approx(2.25, abs=0.1)
+
+    for _ in range(1000):
+        limiter.on_success()
+    assert limiter.limit == 10
+
+
+def test_token_bucket():
+    now = [0.0]
+    bucket = TokenBucket(2, clock=lambda: now[0])
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.5)
+    now[0] += 1.5
+    assert bucket.reserve() == 0
+
+
+def test_throttle_retries():
+    sleeps = []
+    throttle = Throttle(sleep=sleeps.append)
+    responses = [client_error("SlowDown", 503), client_error("SlowDown", 503), "done"]
+
+    def request():
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    assert throttle.call("get", "read", "ab12", request) == "done"
+    assert len(sleeps) == 2
+    assert throttle.limiter.limit < 8
+    assert throttle.limiter.active == 0
+
+
+def test_throttle_gives_up():
+    throttle = Throttle(attempts=3, sleep=lambda _: None)
+    calls = []
+
+    def slow_down():
+        calls.append(1)
+        raise client_error("SlowDown", 503)
+
+    with pytest.raises(ClientError):
+        throttle.call("get", "read", "ab12", slow_down)
+    assert len(calls) == 3
+
+    def missing():
+        calls.append(1)
+        raise client_error("NoSuchKey", 404)
+
+    with pytest.raises(ClientError):
+        throttle.call("get", "read", "ab12", missing)
+    assert len(calls) == 4
+    assert throttle.limiter.active == 0
+
+
+def test_throttle_converges_under_store_limit():
+    """
+    A store throttling above 4 concurrent requests ends up serving everything with the limit around its capacity
+    """
+    capacity = 4
+    in_flight = [0]
+    lock = threading.Lock()
+    limiter = AdaptiveLimiter(initial=16, maximum=32, )
+    throttle = Throttle(limiter, sleep=lambda delay: time.sleep(delay / 100))
+
+    def request():
+        with lock:
+            in_flight[0] += 1
+            throttled = in_flight[0] > capacity
+        try:
+            if throttled:
+                raise client_error("SlowDown", 503)
+            time.sleep(0.001)
+            return True
+        finally:
+            with lock:
+                in_flight[0] -= 1
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        futures = [executor.submit(throttle.call, "get", "read", f"{i:x}", request) for i in range(400)]
+        assert all(future.result() for future in futures)
+    assert throttle.limiter.limit <= 2 * capacity
@@ -95,3 +95,37 @@ def test_cmdline_pull_cmd():
 def test_cmdline_filter_smudge(monkeypatch, s3_gitrepo):
     monkeypatch.setattr("sys.stdin", io.BytesIO(b"fat content a"))
     s3_gitrepo.run("git-fat filter-smudge")
+
+
+def test_bundle_cmd(s3_gitrepo, s3_cloned_gitrepo):
+    bundle = s3_gitrepo.workspace / "fat.bundle"
+    s3_gitrepo.run(f"git fat bundle create -o {bundle} HEAD")
+    s3_cloned_gitrepo.run("git fat init")
+    s3_cloned_gitrepo.run(f"git fat bundle unbundle {bundle}")
+    (s3_cloned_gitrepo.workspace / "a.fat").unlink()
+    s3_cloned_gitrepo.run("git checkout -- a.fat")
+    assert (s3_cloned_gitrepo.workspace / "a.fat").read_text() == "fat content a\n"
+
+
+def test_status_cmd(s3_gitrepo):
+    s3_gitrepo.run("git fat push")
+    output = s3_gitrepo.run("git fat status --list", capture=True)
+    assert "stub-only files: 0 (0 B)" in output
+    assert "unpushed objects: 0 (0 B)" in output
+
+
+def test_find_cmd(s3_gitrepo):
+    (s3_gitrepo.workspace / "big file.bin").write_bytes(os.urandom(2000))
+    s3_gitrepo.run("git add --all")
+    s3_gitrepo.run("git commit --no-gpg-sign -m 'big'")
+    output = s3_gitrepo.run("git fat find 1000", capture=True)
+    assert output.strip() == "/big[[:space:]]file.bin filter=fat -text #       2000 1"
+
+
+def test_profile_report_cmd(s3_gitrepo, tmp_path, monkeypatch):
+    monkeypatch.setenv("GIT_FAT_PROFILE", str(tmp_path))
+    (s3_gitrepo.workspace / "c.fat").write_bytes(os.urandom(100))
+    s3_gitrepo.run("git add c.fat")
+    output = s3_gitrepo.run("git fat profile-report --command filter-clean --limit 5", capture=True)
+    assert output.startswith("1 profiles: filter-clean x1")
+    assert "filter_clean" in output
@@ -0,0 +1,41 @@
+import pytest
+
+from git_fat.profiling import list_profiles, merge_profiles, run_profiled
+
+
+def busy_work():
+    return sum(i * i for i in range(10000))
+
+
+def test_run_profiled(tmp_path):
+    assert run_profiled(tmp_path, "filter-clean", lambda: busy_work() and "abc123") == "abc123"
+    (profile,) = tmp_path.iterdir()
+    command, pid, _, object_id = profile.stem.rsplit("-", 3)
+    assert command == "filter-clean"
+    assert pid.isdigit()
+    assert object_id == "abc123"
+
+
+def test_run_profiled_exit(tmp_path):
+    def exiting():
+        busy_work()
+        raise SystemExit(1)
+
+    with pytest.raises(SystemExit):
+        run_profiled(tmp_path, "fscheck", exiting)
+    assert [path.name.endswith("-none.pstats") for path in tmp_path.iterdir()] == [True]
+
+
+def test_merge_profiles(tmp_path):
+    run_profiled(tmp_path, "filter-clean", busy_work)
+    run_profiled(tmp_path, "filter-clean", busy_work)
+    run_profiled(tmp_path, "pull", busy_work)
+    (tmp_path / "notes.txt").write_text("not a profile")
+
+    assert len(list_profiles(tmp_path)) == 3
+    assert len(list_profiles(tmp_path, ["filter-clean"])) == 2
+    assert len(list_profiles(tmp_path, ["filter"])) == 0
+
+    report = merge_profiles(list_profiles(tmp_path, ["filter-clean"]), sort="tottime", limit=5)
+    assert "Ordered by: internal time" in report
+    assert "busy_work" in report
@@ -0,0 +1,61 @@
+import json
+
+from git_fat import tracing
+from git_fat.tracing import Span, Tracer, parse_outputs
+
+
+def test_parse_outputs(capsys):
+    outputs = parse_outputs("summary, chrome:/tmp/{pid}.json,prometheus:/tmp/git-fat.prom,chrome,bogus")
+    assert outputs == [("summary", ""), ("chrome", "/tmp/{pid}.json"), ("prometheus", "/tmp/git-fat.prom")]
+    assert "'chrome'" in capsys.readouterr().err
+    assert parse_outputs("") == []
+
+
+def test_span_disabled():
+    with Span(None, "noop") as span:
+        span.bytes += 10
+    assert span.duration_ns == 0
+
+
+def test_tracer_outputs(tmp_path, capsys):
+    tracer = Tracer(
+        [("summary", ""), ("chrome", str(tmp_path / "{command}.json")), ("prometheus", str(tmp_path / "metrics.prom"))]
+    )
+    tracer.command = "pull"
+    for _ in range(2):
+        with Span(tracer, "s3.download", count=1) as span:
+            span.bytes = 1024
+    with Span(tracer, "update-index", count=3):
+        pass
+
+    assert tracer.totals()["s3.download"][0] == 2
+    assert tracer.totals()["s3.download"][2] == 2048
+    tracer.report()
+
+    summary = capsys.readouterr().err
+    assert "git-fat pull trace:" in summary
+    assert "s3.download" in summary and "update-index" in summary
+
+    trace = json.loads((tmp_path / "pull.json").read_text())
+    events = trace["traceEvents"]
+    assert [event["name"] for event in events] == ["s3.download", "s3.download", "update-index"]
+    assert all(event["ph"] == "X" and event["dur"] >= 0 for event in events)
+    assert events[0]["args"] == {"bytes": 1024, "count": 1}
+
+    metrics = (tmp_path / "metrics.prom").read_text()
+    assert 'git_fat_span_calls{command="pull",span="s3.download"} 2' in metrics
+    assert 'git_fat_span_bytes{command="pull",span="s3.download"} 2048' in metrics
+    assert 'git_fat_span_items{command="pull",span="update-index"} 3' in metrics
+    assert "# TYPE git_fat_span_seconds gauge" in metrics
+
+
+def test_traced(monkeypatch):
+    tracer = Tracer([])
+    monkeypatch.setattr(tracing, "_tracer", tracer)
+
+    @tracing.traced("discover")
+    def discover():
+        return {"a", "b"}
+
+    assert discover() == {"a", "b"}
+    assert [(span.name, span.count) for span in tracer.spans] == [("discover", 2)]
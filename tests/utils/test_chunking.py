@@ -0,0 +1,37 @@
+import random
+import pytest
+from git_fat.utils.chunking import iter_chunks, encode_recipe, decode_recipe
+
+CHUNKING = {"min_size": 1024, "avg_size": 4096, "max_size": 16384}
+
+
+def random_bytes(size, seed=0):
+    return random.Random(seed).randbytes(size)
+
+
+def test_iter_chunks_is_independent_of_block_size():
+    data = random_bytes(200 * 1024)
+    small_blocks = [data[i : i + 100] for i in range(0, len(data), 100)]
+    large_blocks = [data[i : i + 50000] for i in range(0, len(data), 50000)]
+    chunks = list(iter_chunks(small_blocks, **CHUNKING))
+    assert chunks == list(iter_chunks(large_blocks, **CHUNKING))
+    assert b"".join(chunks) == data
+    assert all(len(chunk) <= CHUNKING["max_size"] for chunk in chunks)
+    assert all(len(chunk) >= CHUNKING["min_size"] for chunk in chunks[:-1])
+
+
+def test_iter_chunks_resynchronizes_after_edit():
+    data = random_bytes(200 * 1024)
+    edited = data[:5000] + b"inserted bytes" + data[5000:]
+    chunks = set(iter_chunks([data], **CHUNKING))
+    edited_chunks = list(iter_chunks([edited], **CHUNKING))
+    shared = [chunk for chunk in edited_chunks if chunk in chunks]
+    assert len(shared) >= len(edited_chunks) - 2
+
+
+def test_recipe_roundtrip():
+    chunks = [("a" * 40, 10), ("b" * 40, 20)]
+    recipe = encode_recipe("c" * 40, 30, chunks)
+    assert decode_recipe(recipe) == ("c" * 40, 30, chunks)
+    with pytest.raises(ValueError):
+        decode_recipe(b"not a recipe")
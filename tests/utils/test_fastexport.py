@@ -0,0 +1,39 @@
+from git_fat.utils.fastexport import rewrite_fast_export, unquote_path
+import io
+
+STREAM = b"""blob
+mark :1
+data 5
+hello
+commit refs/heads/master
+mark :2
+committer A <a@example.com> 0 +0000
+data 25
+M 100644 aaaa fake line
+
+M 100644 1111111111111111111111111111111111111111 big.bin
+M 100755 2222222222222222222222222222222222222222 "dir/with \\"quotes\\".bin"
+M 100644 :1 marked.bin
+M 120000 3333333333333333333333333333333333333333 link.bin
+
+"""
+
+
+def test_unquote_path():
+    assert unquote_path(b"plain path") == b"plain path"
+    assert unquote_path(b'"a \\"b\\"\\303\\251"') == 'a "b"é'.encode()
+
+
+def test_rewrite_fast_export():
+    seen = []
+
+    def replace_blob(sha, path):
+        seen.append((sha, path))
+        return "f" * 40 if path == b"big.bin" else None
+
+    with io.BytesIO(STREAM) as input_handle, io.BytesIO() as output_handle:
+        rewrite_fast_export(input_handle, output_handle, replace_blob)
+        rewritten = output_handle.getvalue()
+
+    assert seen == [("1" * 40, b"big.bin"), ("2" * 40, b'dir/with "quotes".bin')]
+    assert rewritten == STREAM.replace(b"1" * 40, b"f" * 40)
@@ -1,4 +1,5 @@
-from git_fat.utils import FatRepo
+from git_fat.utils import FatRepo, FatObj
+from git_fat.utils.common import tostr
 from git_fat.fatstores import S3FatStore
 from pytest_git import GitRepo
 import pytest
@@ -6,6 +7,7 @@ import os
 import io
 import sys
 import subprocess
+import hashlib
 
 
 def test_get_indexed_fatobjs(fatrepo):
@@ -31,7 +33,7 @@ def test_filter_clean(cloned_fatrepo: FatRepo, resource_path):
     with open(fatfile, "rb") as fatstream:
         fatrepo.filter_clean(fatstream, sys.stdout.buffer)
 
-    fatcache = fatrepo.objdir / expected_sha1_digest
+    fatcache = fatrepo.object_path(expected_sha1_digest)
     print(f"Expecting following file: {fatcache}")
     assert fatcache.exists()
 
@@ -143,9 +145,385 @@ def test_publish_added_fatobjs(fatrepo: FatRepo, s3_smudgestore: S3FatStore):
     )
 
     subprocess.run(["git-fat", "push"], cwd=str(fatrepo.workspace), stdout=sys.stdout, stderr=sys.stderr)
-    new_fatobj_cache = fatrepo.objdir / "1d76f0a0a53de1d5255240d6aec3a383b700ca98"
+    new_fatobj_cache = fatrepo.object_path("1d76f0a0a53de1d5255240d6aec3a383b700ca98")
     os.remove(str(new_fatobj_cache))
 
     master = fatrepo.gitapi.commit("master")
     fatrepo.publish_added_fatobjs(master)
     print(s3_smudgestore.list())
+
+
+def test_chunked_filter_roundtrip(fatrepo: FatRepo, cloned_fatrepo: FatRepo):
+    chunking = "\n[s3.chunking]\nmin_size = 1024\navg_size = 4096\nmax_size = 16384\n"
+    for repo in [fatrepo, cloned_fatrepo]:
+        repo.gitfat_config_path.write_text(repo.gitfat_config_path.read_text() + chunking)
+    content = os.urandom(100 * 1024)
+
+    with io.BytesIO(content) as in_file, io.BytesIO() as out_file:
+        fatrepo.filter_clean(in_file, out_file)
+        fatstub = out_file.getvalue()
+    fatid, size = fatrepo.decode_fatstub(fatstub)
+    assert size == len(content)
+    assert fatrepo.recipe_path(tostr(fatid)).exists()
+    assert not fatrepo.object_path(tostr(fatid)).exists()
+
+    with io.BytesIO(fatstub) as in_file, io.BytesIO() as out_file:
+        fatrepo.filter_smudge(in_file, out_file)
+        assert out_file.getvalue() == content
+
+    fatobj = FatObj(fatid=tostr(fatid), path="big.fat", size=size)
+    fatrepo.push_fatobjs([fatobj])
+    assert fatrepo.is_on_remote(fatobj.fatid, set(fatrepo.fatstore.list()))
+
+    cloned_fatrepo.download_fatobj(fatobj.fatid, set(cloned_fatrepo.fatstore.list()))
+    assert cloned_fatrepo.is_fatobj_cached(fatobj.fatid)
+    cloned_fatrepo.assemble_fatobj(fatobj.fatid, cloned_fatrepo.get_abspath(fatobj))
+    assert (cloned_fatrepo.workspace / "big.fat").read_bytes() == content
+
+
+def test_packed_push_and_pull(fatrepo: FatRepo, cloned_fatrepo: FatRepo):
+    for repo in [fatrepo, cloned_fatrepo]:
+        config = repo.gitfat_config_path.read_text().replace("[s3]\n", "[s3]\npack_threshold = 1024\n", 1)
+        repo.gitfat_config_path.write_text(config)
+
+    fatobjs = []
+    for i in range(3):
+        content = os.urandom(100)
+        with io.BytesIO(content) as in_file, io.BytesIO() as out_file:
+            fatrepo.filter_clean(in_file, out_file)
+            fatid, size = fatrepo.decode_fatstub(out_file.getvalue())
+        fatobjs.append(
+            FatObj(fatid=tostr(fatid), path=f"{i}.fat", size=size)
+        )
+    fatrepo.push_fatobjs(fatobjs)
+    remote_fatfiles = set(fatrepo.fatstore.list())
+    for fatobj in fatobjs:
+        assert fatobj.fatid not in remote_fatfiles
+        assert fatrepo.is_on_remote(fatobj.fatid, remote_fatfiles)
+
+    wanted = {fatobj.fatid for fatobj in fatobjs[:2]}
+    cloned_fatrepo.download_packed_fatobjs(wanted, set(cloned_fatrepo.fatstore.list()))
+    for fatobj in fatobjs:
+        assert cloned_fatrepo.is_fatobj_cached(fatobj.fatid) == (fatobj.fatid in wanted)
+        if fatobj.fatid in wanted:
+            expected = fatrepo.object_path(fatobj.fatid).read_bytes()
+            assert cloned_fatrepo.object_path(fatobj.fatid).read_bytes() == expected
+
+
+def test_bundle_roundtrip(fatrepo: FatRepo, cloned_fatrepo: FatRepo):
+    fatobjs = fatrepo.get_tree_fatobjs(fatrepo.gitapi.head.commit)
+    assert {fatobj.path for fatobj in fatobjs} == {"a.fat", "b.fat"}
+
+    with io.BytesIO() as bundle:
+        fatrepo.create_bundle(fatobjs, bundle)
+        bundle.seek(0)
+        cloned_fatrepo.unbundle(bundle)
+    for fatobj in fatobjs:
+        assert cloned_fatrepo.is_fatobj_cached(fatobj.fatid)
+
+    with io.BytesIO() as bundle:
+        fatrepo.create_bundle(fatobjs, bundle)
+        corrupted = bundle.getvalue().replace(b"fat content a", b"fat content x")
+    for fatobj in fatobjs:
+        os.remove(cloned_fatrepo.object_path(fatobj.fatid))
+    with pytest.raises(SystemExit):
+        cloned_fatrepo.unbundle(io.BytesIO(corrupted))
+
+
+def test_get_fatobjs_in_revs(fatrepo: FatRepo):
+    fatobjs = fatrepo.get_fatobjs_in_revs(["HEAD"])
+    assert {fatobj.path for fatobj in fatobjs} == {"a.fat", "b.fat"}
+    assert fatobjs == fatrepo.get_indexed_fatobjs()
+    assert fatrepo.get_fatobjs_in_revs(["HEAD", "--not", "HEAD"]) == set()
+
+
+def test_pre_push(s3_gitrepo: GitRepo, fatrepo: FatRepo):
+    base = fatrepo.gitapi.head.commit.hexsha
+    (s3_gitrepo.workspace / "pushed.fat").write_bytes(os.urandom(64))
+    s3_gitrepo.run("git add pushed.fat")
+    s3_gitrepo.run("git commit --no-gpg-sign -m 'add pushed.fat'")
+    head = fatrepo.gitapi.head.commit.hexsha
+
+    (pushed,) = fatrepo.get_fatobjs_in_revs([head, "--not", base])
+    assert pushed.path == "pushed.fat"
+    assert not fatrepo.is_on_remote(pushed.fatid, set(fatrepo.fatstore.list()))
+    fatrepo.pre_push("origin", [("refs/heads/master", head, "refs/heads/master", base)])
+    assert fatrepo.is_on_remote(pushed.fatid, set(fatrepo.fatstore.list()))
+
+
+def test_get_history_fatobjs(s3_gitrepo: GitRepo, fatrepo: FatRepo):
+    s3_gitrepo.run("git checkout -B history")
+    (s3_gitrepo.workspace / "a.fat").write_text("fat content a, revised")
+    s3_gitrepo.run("git commit --no-gpg-sign -am 'revise a.fat'")
+
+    fatobjs = fatrepo.get_history_fatobjs()
+    assert len({fatobj.fatid for fatobj in fatobjs}) == 3
+    assert fatrepo.history_cache_path.exists()
+
+    (s3_gitrepo.workspace / "a.fat").write_text("fat content a, revised again")
+    s3_gitrepo.run("git commit --no-gpg-sign -am 'revise a.fat again'")
+    cached_tips, _ = fatrepo.read_history_cache()
+    fatobjs = fatrepo.get_history_fatobjs()
+    assert len({fatobj.fatid for fatobj in fatobjs}) == 4
+    assert cached_tips != fatrepo.read_history_cache()[0]
+
+    head_only = fatrepo.get_history_fatobjs(["HEAD~1..HEAD"])
+    assert [fatobj.path for fatobj in head_only] == ["a.fat"]
+
+
+def test_get_unreferenced_remote_files(fatrepo: FatRepo, tmp_path):
+    fatrepo.push()
+    orphan = tmp_path / "0123456789abcdef0123456789abcdef01234567"
+    orphan.write_text("orphan")
+    fatrepo.fatstore.upload(str(orphan))
+
+    unreferenced = fatrepo.get_unreferenced_remote_files()
+    assert orphan.name in unreferenced
+    for fatobj in fatrepo.get_indexed_fatobjs():
+        assert fatobj.fatid not in unreferenced
+    fatrepo.fatstore.delete(orphan.name)
+
+
+def test_pull_history(fatrepo: FatRepo, cloned_fatrepo: FatRepo):
+    fatrepo.push()
+    cloned_fatrepo.gitapi.git.execute(command=["git", "fat", "init"])
+    cloned_fatrepo.pull_history()
+    assert (cloned_fatrepo.workspace / "a.fat").read_text() == "fat content a\n"
+
+
+def test_prune_remote(fatrepo: FatRepo, tmp_path):
+    fatrepo.push()
+    orphan = tmp_path / "89abcdef0123456789abcdef0123456789abcdef"
+    orphan.write_text("orphan")
+    fatrepo.fatstore.upload(str(orphan))
+
+    # orphan is within grace period
+    assert fatrepo.prune_remote(dry_run=True) == (0, 0)
+    count, size = fatrepo.prune_remote(grace_days=-1, dry_run=True)
+    assert count >= 1 and size >= len("orphan")
+    assert orphan.name in fatrepo.fatstore.list()
+
+    fatrepo.prune_remote(refs=["refs/heads/*"], grace_days=-1)
+    remote_fatfiles = set(fatrepo.fatstore.list())
+    assert orphan.name not in remote_fatfiles
+    for fatobj in fatrepo.get_indexed_fatobjs():
+        assert fatrepo.is_on_remote(fatobj.fatid, remote_fatfiles)
+
+
+def test_get_prune_rev_args(fatrepo: FatRepo):
+    assert fatrepo.get_prune_rev_args() == ["--all"]
+    assert fatrepo.get_prune_rev_args(["refs/heads/*", "--remotes=origin", "v1.0"]) == [
+        "--glob=refs/heads/*",
+        "--remotes=origin",
+        "v1.0",
+    ]
+
+
+def test_pull_restores_shared_fatobj_once(s3_gitrepo: GitRepo, fatrepo: FatRepo, s3_cloned_gitrepo, monkeypatch):
+    shared = os.urandom(64)
+    (s3_gitrepo.workspace / "copy").mkdir()
+    (s3_gitrepo.workspace / "one.fat").write_bytes(shared)
+    (s3_gitrepo.workspace / "copy" / "two.fat").write_bytes(shared)
+    s3_gitrepo.run("git add --all")
+    s3_gitrepo.run("git commit --no-gpg-sign -m 'add shared fat'")
+    fatrepo.push()
+
+    s3_cloned_gitrepo.run("git pull")
+    cloned_fatrepo = FatRepo(s3_cloned_gitrepo.workspace)
+    downloads = []
+    download = cloned_fatrepo.fatstore.download
+    monkeypatch.setattr(cloned_fatrepo.fatstore, "download", lambda *args: downloads.append(args) or download(*args))
+    cloned_fatrepo.pull_all()
+
+    assert (s3_cloned_gitrepo.workspace / "one.fat").read_bytes() == shared
+    assert (s3_cloned_gitrepo.workspace / "copy" / "two.fat").read_bytes() == shared
+    assert len([args for args in downloads if args[0] == hashlib.sha1(shared).hexdigest()]) == 1
+    status = cloned_fatrepo.gitapi.git.status("--porcelain")
+    assert status == ""
+
+
+def test_pull_pathspecs(s3_gitrepo: GitRepo, fatrepo: FatRepo, s3_cloned_gitrepo):
+    (s3_gitrepo.workspace / "levels" / "forest").mkdir(parents=True)
+    (s3_gitrepo.workspace / "levels" / "desert").mkdir(parents=True)
+    (s3_gitrepo.workspace / "levels" / "forest" / "tree.fat").write_text("fat tree")
+    (s3_gitrepo.workspace / "levels" / "desert" / "cactus.fat").write_text("fat cactus")
+    s3_gitrepo.run("git add --all")
+    s3_gitrepo.run("git commit --no-gpg-sign -m 'add levels'")
+    fatrepo.push()
+
+    s3_cloned_gitrepo.run("git pull")
+    s3_cloned_gitrepo.run("git fat init")
+    cloned_fatrepo = FatRepo(s3_cloned_gitrepo.workspace)
+    tree = s3_cloned_gitrepo.workspace / "levels" / "forest" / "tree.fat"
+    cactus = s3_cloned_gitrepo.workspace / "levels" / "desert" / "cactus.fat"
+
+    assert {fatobj.path for fatobj in cloned_fatrepo.get_indexed_fatobjs(["levels"])} == {
+        "levels/forest/tree.fat",
+        "levels/desert/cactus.fat",
+    }
+    cloned_fatrepo.pull_pathspecs(["levels"], excludes=["levels/desert/*"])
+    assert tree.read_text() == "fat tree"
+    assert cactus.read_text() != "fat cactus"
+
+    s3_cloned_gitrepo.run("git sparse-checkout set --no-cone /*.fat /.git* /levels/forest/")
+    cloned_fatrepo.pull_all()
+    assert not cactus.exists()
+    cloned_fatrepo.pull_pathspecs([], includes=["**/*.fat"])
+    assert not cactus.exists()
+
+
+def test_fatstore_check_files_probes_remote(fatrepo: FatRepo, monkeypatch):
+    fatrepo.push()
+    list_remote = fatrepo.fatstore.list
+
+    def list_prefix_only(prefix=""):
+        assert prefix, "file scoped fscheck must not list the whole fatstore"
+        return list_remote(prefix)
+
+    monkeypatch.setattr(fatrepo.fatstore, "list", list_prefix_only)
+    a_fat = fatrepo.workspace / "a.fat"
+    fatrepo.fatstore_check([a_fat, fatrepo.workspace / ".gitattributes"])
+
+    (a_fatobj,) = fatrepo.get_indexed_fatobjs(["a.fat"])
+    fatrepo.fatstore.delete(a_fatobj.fatid)
+    with pytest.raises(SystemExit):
+        fatrepo.fatstore_check([a_fat])
+
+
+def test_get_added_fatobjs_by_ref(s3_gitrepo: GitRepo, fatrepo: FatRepo):
+    gitrepo = s3_gitrepo
+    gitrepo.run("git checkout -B more_fat")
+    (gitrepo.workspace / "c.fat").write_text("fat content c")
+    gitrepo.run("git add --all")
+    gitrepo.run("git commit --no-gpg-sign -m 'adding c.fat'")
+    fatrepo.push()
+    (gitrepo.workspace / "d.fat").write_bytes(os.urandom(64))
+    gitrepo.run("git add --all")
+
+    added = fatrepo.get_added_fatobjs_by_ref(["master", "more_fat", "master..more_fat"])
+    assert {fatobj.path for fatobj in added["master"]} == {"c.fat", "d.fat"}
+    assert {fatobj.path for fatobj in added["more_fat"]} == {"d.fat"}
+    assert {fatobj.path for fatobj in added["master..more_fat"]} == {"c.fat"}
+    assert added["master"] == fatrepo.get_added_fatobjs(gitrepo.api.commit("master"))
+
+    added_to_head = fatrepo.get_added_fatobjs_by_ref(["master"], "HEAD")
+    assert {fatobj.path for fatobj in added_to_head["master"]} == {"c.fat"}
+
+    fatrepo.fatstore_check_refs(["master..more_fat"])
+    with pytest.raises(SystemExit):
+        fatrepo.fatstore_check_refs(["master", "more_fat"])
+
+
+def test_add(s3_gitrepo: GitRepo, fatrepo: FatRepo, monkeypatch):
+    dataset = s3_gitrepo.workspace / "dataset"
+    dataset.mkdir()
+    contents = {f"dataset/{i}.fat": os.urandom(1024 + i) for i in range(4)}
+    for path, data in contents.items():
+        (s3_gitrepo.workspace / path).write_bytes(data)
+        os.utime(s3_gitrepo.workspace / path, ns=(1_000_000_000, 1_000_000_000))
+    (dataset / "README.txt").write_text("not fat")
+
+    fatrepo.add(["dataset"], jobs=2)
+    staged = fatrepo.gitapi.git.ls_files("--stage").splitlines()
+    assert any(line.endswith("\tdataset/README.txt") for line in staged)
+    for path, data in contents.items():
+        fatid = hashlib.sha1(data).hexdigest()
+        assert fatrepo.object_path(fatid).read_bytes() == data
+        assert fatrepo.gitapi.git.show(f":{path}") == fatrepo.encode_fatstub(fatid, len(data)).strip()
+        assert fatrepo.lookup_stat_cache(path) == (fatid, len(data))
+
+    # unchanged files are neither read nor hashed again, by git fat add or filter-clean
+    monkeypatch.setattr(fatrepo, "ingest_file", lambda path: pytest.fail(f"{path} hashed again"))
+    fatrepo.add(["dataset"], jobs=1)
+    with io.BytesIO(b"never read") as in_file, io.BytesIO() as out_file:
+        fatrepo.filter_clean(in_file, out_file, "dataset/0.fat")
+        fatid = hashlib.sha1(contents["dataset/0.fat"]).hexdigest()
+        assert out_file.getvalue() == fatrepo.encode_fatstub(fatid, 1024).encode()
+    status = fatrepo.gitapi.git.status("--porcelain", "dataset").splitlines()
+    assert status == [f"A  {path}" for path in sorted(contents)] + ["A  dataset/README.txt"]
+
+
+def test_filter_clean_reads_path(s3_gitrepo: GitRepo, fatrepo: FatRepo):
+    data = os.urandom(1024 * 1024)
+    (s3_gitrepo.workspace / "big.fat").write_bytes(data)
+    with open(s3_gitrepo.workspace / "big.fat", "rb") as in_file, io.BytesIO() as out_file:
+        in_file.read(10)
+        fatrepo.filter_clean(in_file, out_file, "big.fat")
+        expected = fatrepo.encode_fatstub(hashlib.sha1(data[10:]).hexdigest(), len(data) - 10)
+        assert out_file.getvalue() == expected.encode()
+
+    # git streams the same file the filter reads from disk, the unread rest of the stream is fine
+    s3_gitrepo.run("git add big.fat")
+    fatid = hashlib.sha1(data).hexdigest()
+    assert fatrepo.gitapi.git.show(":big.fat") == fatrepo.encode_fatstub(fatid, len(data)).strip()
+    assert fatrepo.object_path(fatid).read_bytes() == data
+
+
+def test_sharded_objects(fatrepo: FatRepo):
+    (fatid,) = {fatobj.fatid for fatobj in fatrepo.get_indexed_fatobjs(["a.fat"])}
+    assert fatrepo.object_path(fatid) == fatrepo.objdir / fatid[:2] / fatid
+    assert fatid in fatrepo.get_local_objects()
+
+    # caches written flat by older versions are still read, then moved into shards
+    os.rename(fatrepo.object_path(fatid), fatrepo.objdir / fatid)
+    assert fatrepo.is_fatobj_cached(fatid)
+    (fatrepo.objdir / ".sharded").unlink()
+    migrated = FatRepo(fatrepo.workspace)
+    assert migrated.object_path(fatid) == fatrepo.objdir / fatid[:2] / fatid
+    assert migrated.object_path(fatid).exists()
+    assert not (fatrepo.objdir / fatid).exists()
+
+
+def test_status(s3_gitrepo: GitRepo, fatrepo: FatRepo):
+    assert fatrepo.status().unpushed is None
+    status = fatrepo.status(refresh_remote=True)
+    assert status.stubs == [] and status.orphans == []
+
+    fatrepo.push()
+    assert fatrepo.status().unpushed == []
+
+    (a_fatobj,) = fatrepo.get_indexed_fatobjs(["a.fat"])
+    (s3_gitrepo.workspace / "a.fat").write_text(fatrepo.encode_fatstub(a_fatobj.fatid, a_fatobj.size))
+    with io.BytesIO(b"orphaned content") as in_file, io.BytesIO() as out_file:
+        fatrepo.filter_clean(in_file, out_file)
+    (s3_gitrepo.workspace / "c.fat").write_bytes(os.urandom(64))
+    s3_gitrepo.run("git add c.fat")
+
+    status = FatRepo(fatrepo.workspace).status()
+    assert status.stubs == [a_fatobj]
+    assert status.stub_bytes == a_fatobj.size
+    assert status.orphans == [(hashlib.sha1(b"orphaned content").hexdigest(), 16)]
+    assert [fatobj.path for fatobj in status.unpushed] == ["c.fat"]
+    assert status.unpushed_bytes == 64
+
+
+def test_find_large_paths(s3_gitrepo: GitRepo, fatrepo: FatRepo):
+    (s3_gitrepo.workspace / "data").mkdir()
+    for size in [2000, 3000]:
+        (s3_gitrepo.workspace / "data" / "big file.bin").write_bytes(os.urandom(size))
+        (s3_gitrepo.workspace / "small.bin").write_bytes(os.urandom(size // 10))
+        s3_gitrepo.run("git add --all")
+        s3_gitrepo.run(f"git commit --no-gpg-sign -m 'big {size}'")
+
+    assert fatrepo.find_large_paths(1000) == [("data/big file.bin", 3000, 2)]
+    assert fatrepo.find_large_paths(1000, ["HEAD~1"]) == [("data/big file.bin", 2000, 1)]
+
+
+def test_import_history(s3_gitrepo: GitRepo, fatrepo: FatRepo):
+    versions = [os.urandom(2000), os.urandom(3000)]
+    for data in versions:
+        (s3_gitrepo.workspace / "big.bin").write_bytes(data)
+        s3_gitrepo.run("git add big.bin")
+        s3_gitrepo.run("git commit --no-gpg-sign -m 'big.bin'")
+    log = fatrepo.gitapi.git.log("--format=%s")
+    (s3_gitrepo.workspace / ".git" / "info" / "attributes").write_text("*.bin filter=fat -text\n")
+
+    imported = fatrepo.import_history()
+    assert {fatobj.fatid for fatobj in imported} == {hashlib.sha1(data).hexdigest() for data in versions}
+    assert fatrepo.gitapi.git.log("--format=%s") == log
+    for rev, data in [("HEAD", versions[1]), ("HEAD~1", versions[0])]:
+        fatid = hashlib.sha1(data).hexdigest()
+        assert fatrepo.gitapi.git.show(f"{rev}:big.bin") == fatrepo.encode_fatstub(fatid, len(data)).strip()
+        assert fatrepo.object_path(fatid).read_bytes() == data
+    assert (s3_gitrepo.workspace / "big.bin").read_bytes() == versions[1]
+    assert fatrepo.gitapi.git.status("--porcelain") == ""
@@ -0,0 +1,28 @@
+from git_fat.utils.hashcopy import hash_copy_stream, hash_copy_file
+import hashlib
+import io
+import os
+
+
+def test_hash_copy_stream():
+    data = os.urandom(10000)
+    with io.BytesIO(data[100:]) as input_handle, io.BytesIO() as output_handle:
+        sha, size = hash_copy_stream(input_handle, output_handle, data[:100], buffer_size=1024)
+        assert output_handle.getvalue() == data
+    assert size == len(data)
+    assert sha.hexdigest() == hashlib.sha1(data).hexdigest()
+
+
+def test_hash_copy_file(tmp_path):
+    data = os.urandom(10000)
+    source = tmp_path / "source"
+    source.write_bytes(data)
+    with open(source, "rb") as source_handle, open(tmp_path / "destination", "w+b") as destination_handle:
+        copied = hash_copy_file(source_handle.fileno(), destination_handle.fileno(), step=4096, buffer_size=1000)
+    if copied is None:
+        # copy_file_range not supported here
+        return
+    sha, size = copied
+    assert (tmp_path / "destination").read_bytes() == data
+    assert size == len(data)
+    assert sha.hexdigest() == hashlib.sha1(data).hexdigest()
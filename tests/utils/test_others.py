@@ -10,3 +10,10 @@ def test_tostr():
 
     with pytest.raises(ValueError):
         tostr(1)
+
+
+def test_fatobj_dedup():
+    from git_fat.utils import FatObj
+
+    fatobjs = {FatObj("a" * 40, "a.fat", 1), FatObj("a" * 40, "a.fat", 1), FatObj("a" * 40, "b.fat", 1)}
+    assert len(fatobjs) == 2
@@ -0,0 +1,37 @@
+from git_fat.utils.packing import (
+    coalesce_ranges,
+    decode_pack_index,
+    group_for_packing,
+    is_pack_index,
+    pack_name,
+    write_pack,
+)
+
+
+def test_write_pack(tmp_path):
+    objects = []
+    for name, content in [("a", b"aaa"), ("b", b"bbbbb")]:
+        path = tmp_path / name
+        path.write_bytes(content)
+        objects.append((name, path))
+    pack_dir = tmp_path / "packs"
+    pack_dir.mkdir()
+
+    pack_path, index_path = write_pack(objects, pack_dir)
+    assert is_pack_index(index_path.name)
+    assert pack_name(index_path.name) == pack_path.name
+    assert pack_path.read_bytes() == b"aaabbbbb"
+    assert decode_pack_index(index_path.read_bytes()) == [("a", 0, 3), ("b", 3, 5)]
+
+
+def test_group_for_packing(tmp_path):
+    objects = [(str(i), tmp_path / str(i), 40) for i in range(5)]
+    groups = group_for_packing(objects, max_size=100)
+    assert [len(group) for group in groups] == [2, 2, 1]
+
+
+def test_coalesce_ranges():
+    entries = [("c", 1000, 10), ("a", 0, 10), ("b", 15, 10)]
+    ranges = coalesce_ranges(entries, gap=10)
+    assert [(start, end) for start, end, _ in ranges] == [(0, 25), (1000, 1010)]
+    assert [fatid for fatid, _, _ in ranges[0][2]] == ["a", "b"]